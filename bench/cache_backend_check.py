@@ -0,0 +1,77 @@
+"""
+Verificaciones de RedisBackend / TieredBackend contra bench/resp_server.py.
+
+    python bench/cache_backend_check.py
+
+- Un error del servidor a mitad de un pipeline (-OOM) no desincroniza la
+  conexión: la siguiente lectura recibe su propia respuesta.
+- Con disco local + Redis, los archivos locales quedan en JSON plano y en
+  Redis los valores van comprimidos.
+- get_many / set_many hacen un solo viaje por lote.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench import resp_server
+from engine.cache_backends import COMPRESSED_MAGIC, LocalDiskBackend, RedisBackend, RedisError, TieredBackend
+from engine.cache_manager import CacheManager
+
+
+def check_pipeline_error(port):
+    backend = RedisBackend(port=port, prefix="oom:", compress=False)
+    try:
+        backend.set_many({"a": b"VERDICT_A", "b": b"VERDICT_B", "c": b"VERDICT_C"})
+        raise AssertionError("se esperaba -OOM")
+    except RedisError as e:
+        print(f"set_many con -OOM: {e}")
+    assert backend.get("a") == b"VERDICT_A", "la lectura de 'a' no recibió su respuesta"
+    assert backend.get("b") is None, "la lectura de 'b' recibió la respuesta de otra clave"
+    assert backend.get_many(["a", "c"]) == {"a": b"VERDICT_A", "c": None}
+    print("pipeline con error: conexión sincronizada")
+
+
+def check_tiered_compression(port):
+    cache_dir = tempfile.mkdtemp(prefix="kashrut-cache-")
+    remote = RedisBackend(port=port, prefix="tiered:")
+    cache = CacheManager(backend=TieredBackend(LocalDiskBackend(cache_dir), remote))
+    result = {"resultado": "Kosher", "alertas": ["Ninguno"] * 20}
+    cache.save_many([(b"producto-1", result), (b"producto-2", result)])
+
+    local_files = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)]
+    assert len(local_files) == 2
+    for path in local_files:
+        with open(path, "rb") as f:
+            assert json.loads(f.read()) == result, "el archivo local no es JSON plano"
+    key = os.path.basename(local_files[0])[:-len(".json")]
+    raw = remote.execute([("GET", remote.prefix + key)])[0]
+    assert raw.startswith(COMPRESSED_MAGIC), "el valor en Redis no está comprimido"
+
+    # Otra réplica, con su disco vacío, lee desde Redis en un solo MGET
+    other = CacheManager(backend=TieredBackend(LocalDiskBackend(tempfile.mkdtemp()), remote))
+    assert other.get_many([b"producto-1", b"producto-2", b"producto-3"]) == [result, result, None]
+    print(f"disco local en JSON plano, Redis comprimido ({len(raw)} bytes)")
+
+
+def main():
+    # Con max_keys=1, 'a' cabe y 'b'/'c' reciben -OOM; el resto usa un servidor sin límite
+    limited = resp_server.RespServer(("127.0.0.1", 0), max_keys=1)
+    unlimited = resp_server.RespServer(("127.0.0.1", 0))
+    for server in (limited, unlimited):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        check_pipeline_error(limited.server_address[1])
+        resp_server._store.clear()
+        check_tiered_compression(unlimited.server_address[1])
+    finally:
+        limited.shutdown()
+        unlimited.shutdown()
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Simula llamadas con cola de latencia pesada y compara p99 con y sin hedging.
+
+    python bench/hedging_bench.py --calls 400 --slow-ratio 0.05
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from engine.hedging import CallPool, HedgedCaller
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--base", type=float, default=0.05, help="Latencia típica (s)")
+    parser.add_argument("--slow", type=float, default=1.0, help="Latencia de las llamadas lentas (s)")
+    parser.add_argument("--slow-ratio", type=float, default=0.05)
+    parser.add_argument("--percentile", type=float, default=95)
+    parser.add_argument("--budget", type=float, default=0.1)
+    args = parser.parse_args()
+
+    def model_call():
+        slow = random.random() < args.slow_ratio
+        time.sleep(args.slow if slow else random.uniform(args.base * 0.8, args.base * 1.2))
+        return "ok"
+
+    pool = CallPool(args.concurrency * 2)
+    hedger = HedgedCaller(pool, percentile=args.percentile, budget=args.budget, initial_delay=args.slow)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+        list(clients.map(lambda _: hedger.call(model_call, model_call), range(args.calls)))
+    pool.shutdown(wait=True)
+    print(json.dumps(hedger.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Mide el rendimiento de export/import del historial con una tabla grande.
+
+    python bench/history_export_bench.py --rows 2000000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from engine.history_manager import HistoryManager
+
+
+def _populate(history, rows):
+    details = {
+        "resultado": "Kosher", "confianza_analisis": "92%", "sello_detectado": "OU",
+        "categoria": "Parve", "alertas": ["Ninguno"],
+        "explicacion_halajica": "Producto con sello OU, ingredientes sin aditivos críticos."
+    }
+    conn = sqlite3.connect(history.db_path)
+    batch = []
+    for i in range(rows):
+        details["producto"] = f"Producto {i}"
+        batch.append((f"2026-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}", f"Producto {i}", "Kosher",
+                      "Parve", json.dumps(details, ensure_ascii=False)))
+        if len(batch) == 50000:
+            conn.executemany('INSERT INTO scans (timestamp, product_name, status, category, details) '
+                             'VALUES (?, ?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO scans (timestamp, product_name, status, category, details) '
+                         'VALUES (?, ?, ?, ?, ?)', batch)
+    conn.commit()
+    conn.close()
+
+
+def _measure(label, rows, fn, trace_memory=False):
+    # tracemalloc ralentiza mucho el bucle: solo se activa con --memory
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    line = f"{label:<22} {elapsed:7.1f}s  {rows / elapsed:>10,.0f} filas/s"
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f"  pico {peak / 1e6:6.1f} MB"
+    print(f"{line}  -> {result}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--memory", action="store_true", help="Reporta el pico de memoria (más lento)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = HistoryManager(os.path.join(tmp, "source.db"))
+        _populate(source, args.rows)
+        print(f"Tabla de origen: {args.rows:,} filas")
+
+        for name in ("scans.jsonl", "scans.jsonl.gz", "scans.csv", "scans.csv.gz"):
+            path = os.path.join(tmp, name)
+            _measure(f"export {name}", args.rows, lambda: source.export_history(path), args.memory)
+            print(f"{'':<22} tamaño {os.path.getsize(path) / 1e6:.1f} MB")
+
+        for name in ("scans.jsonl.gz", "scans.csv"):
+            target = HistoryManager(os.path.join(tmp, f"target_{name}.db"))
+            path = os.path.join(tmp, name)
+            _measure(f"import {name}", args.rows, lambda: target.import_history(path), args.memory)
+        # Reimportar sobre la misma base: todo debe omitirse como duplicado
+        _measure("reimport (dedup)", args.rows, lambda: target.import_history(path), args.memory)
+
+
+if __name__ == "__main__":
+    main()
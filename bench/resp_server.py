@@ -0,0 +1,104 @@
+"""
+Servidor en memoria compatible con el protocolo de Redis (subconjunto mínimo)
+para probar RedisBackend / TieredBackend sin instalar Redis.
+
+    python bench/resp_server.py --port 6390
+    KASHRUT_CACHE_URL=redis://localhost:6390/0 streamlit run ui/app.py
+
+Soporta PING, AUTH, SELECT, GET, SET [EX segundos], MGET, DEL y DBSIZE.
+Con --max-keys, los SET de claves nuevas por encima del límite responden -OOM,
+como Redis con maxmemory lleno.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+_store = {}
+_lock = threading.Lock()
+
+
+def _reply(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_reply(v) for v in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _get(key):
+    entry = _store.get(key)
+    if entry is None:
+        return None
+    value, expires = entry
+    if expires and expires < time.time():
+        del _store[key]
+        return None
+    return value
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            name = args[0].upper()
+            with _lock:
+                if name in (b"PING", b"AUTH", b"SELECT"):
+                    out = b"+PONG\r\n" if name == b"PING" else b"+OK\r\n"
+                elif name == b"GET":
+                    out = _reply(_get(args[1]))
+                elif name == b"SET" and self.server.max_keys and args[1] not in _store \
+                        and len(_store) >= self.server.max_keys:
+                    out = b"-OOM command not allowed when used memory > 'maxmemory'.\r\n"
+                elif name == b"SET":
+                    expires = time.time() + int(args[4]) if len(args) > 4 and args[3].upper() == b"EX" else None
+                    _store[args[1]] = (args[2], expires)
+                    out = b"+OK\r\n"
+                elif name == b"MGET":
+                    out = _reply([_get(key) for key in args[1:]])
+                elif name == b"DEL":
+                    out = _reply(sum(1 for key in args[1:] if _store.pop(key, None) is not None))
+                elif name == b"DBSIZE":
+                    out = _reply(len(_store))
+                else:
+                    out = b"-ERR comando no soportado\r\n"
+            self.wfile.write(out)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler=RespHandler, max_keys=None):
+        super().__init__(address, handler)
+        self.max_keys = max_keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor RESP en memoria para pruebas locales")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--max-keys", type=int, default=None, help="Simula maxmemory: -OOM al superar N claves")
+    args = parser.parse_args()
+    with RespServer((args.host, args.port), RespHandler, max_keys=args.max_keys) as server:
+        print(f"Servidor RESP en {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
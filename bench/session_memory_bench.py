@@ -0,0 +1,92 @@
+"""
+Simula N sesiones concurrentes de la app y mide la memoria retenida.
+
+    python bench/session_memory_bench.py --sessions 200
+
+Modo 'legacy': cada sesión retiene imágenes decodificadas, los bytes
+concatenados y el resultado (como antes de SessionStore).
+Modo 'budget': cada sesión guarda solo resultado + miniaturas en SessionStore.
+Cada modo corre en un subproceso para medir el RSS por separado.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from io import BytesIO
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+
+from engine.session_budget import SessionStore, make_thumbnail
+
+RESULT = {
+    "resultado": "Kosher", "confianza_analisis": "92%", "sello_detectado": "OU",
+    "categoria": "Parve", "alertas": ["Ninguno"],
+    "explicacion_halajica": "Producto con sello OU, ingredientes sin aditivos críticos." * 4
+}
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def _upload(width, height, seed):
+    # JPEG con ruido para que el tamaño comprimido sea realista
+    image = Image.effect_noise((width, height), 40 + seed % 20).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def simulate(mode, sessions, photos, width, height):
+    baseline = _rss_mb()
+    store = SessionStore(total_budget=1 << 40, max_idle=3600)
+    legacy_sessions = []
+    for i in range(sessions):
+        uploads = [_upload(width, height, i + p) for p in range(photos)]
+        images = [Image.open(BytesIO(data)) for data in uploads]
+        for img in images:
+            img.load()  # el análisis decodifica las fotos
+        result = dict(RESULT, producto=f"Producto {i}")
+        if mode == "legacy":
+            legacy_sessions.append({"images": images, "combined_bytes": b"".join(uploads), "last_result": result})
+        else:
+            store.put(str(i), "last_result", result)
+            store.put(str(i), "thumbnails", [make_thumbnail(img) for img in images])
+            for img in images:
+                img.close()
+    return {"mode": mode, "sessions": sessions, "rss_mb": round(_rss_mb() - baseline, 1),
+            "accounted_mb": round(store.usage() / 1e6, 2) if mode == "budget" else None}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--photos", type=int, default=2)
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=1200)
+    parser.add_argument("--mode", choices=["legacy", "budget"])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(simulate(args.mode, args.sessions, args.photos, args.width, args.height)))
+        return
+
+    for mode in ("legacy", "budget"):
+        out = subprocess.run([sys.executable, __file__, "--mode", mode, "--sessions", str(args.sessions),
+                              "--photos", str(args.photos), "--width", str(args.width),
+                              "--height", str(args.height)], capture_output=True, text=True, check=True)
+        stats = json.loads(out.stdout)
+        per_session = stats["rss_mb"] / args.sessions
+        line = f"{mode:<7} {args.sessions} sesiones: +{stats['rss_mb']:.1f} MB RSS ({per_session:.2f} MB/sesión)"
+        if stats["accounted_mb"] is not None:
+            line += f", contabilizado {stats['accounted_mb']} MB"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
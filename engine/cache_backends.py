@@ -0,0 +1,291 @@
+"""
+Backends de almacenamiento para CacheManager.
+
+- LocalDiskBackend: un archivo por entrada en un directorio local (comportamiento original).
+- RedisBackend: caché compartida entre réplicas, hablando el protocolo de Redis
+  (RESP) directamente sobre un socket; funciona con Redis, Valkey, KeyDB o
+  cualquier servidor compatible. Comprime los valores con zlib en el servidor.
+- TieredBackend: disco local delante de la caché compartida. Lee local y, si
+  falla, de la compartida (read-through); escribe local de inmediato y la
+  compartida en el momento o en segundo plano (write-behind).
+
+Todos exponen get / set / get_many / set_many sobre claves str y valores bytes.
+"""
+import queue
+import socket
+import threading
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+# Prefix marking zlib-compressed entries; plain JSON entries never start with it
+COMPRESSED_MAGIC = b"KZ1:"
+
+
+def compress_value(value):
+    return COMPRESSED_MAGIC + zlib.compress(value)
+
+
+def decompress_value(value):
+    """Returns the original bytes; values without the prefix are returned as is."""
+    if value is not None and value.startswith(COMPRESSED_MAGIC):
+        return zlib.decompress(value[len(COMPRESSED_MAGIC):])
+    return value
+
+
+class LocalDiskBackend:
+    def __init__(self, cache_dir="data/cache"):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key):
+        path = self._path(key)
+        if path.exists():
+            return path.read_bytes()
+        return None
+
+    def set(self, key, value):
+        # Escritura atómica: otra réplica o hilo nunca ve un archivo a medias
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(value)
+        tmp_path.replace(path)
+
+    def get_many(self, keys):
+        return {key: self.get(key) for key in keys}
+
+    def set_many(self, items):
+        for key, value in items.items():
+            self.set(key, value)
+
+
+class RedisError(Exception):
+    """Respuesta de error del servidor."""
+
+
+def _encode_command(*args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Conexión cerrada por el servidor de caché")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload
+    if kind == b"-":
+        raise RedisError(payload.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(payload)
+        return None if count == -1 else [_read_reply(reader) for _ in range(count)]
+    raise RedisError(f"Respuesta no reconocida: {line!r}")
+
+
+class RedisBackend:
+    """Cliente RESP mínimo (GET/SET/MGET con pipeline), una conexión por hilo."""
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, prefix="kashrut:cache:",
+                 ttl=None, timeout=2.0, retry_after=5.0, compress=True):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.compress = compress
+        self._down_until = 0.0
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        if self.password:
+            self._send([("AUTH", self.password)])
+        if self.db:
+            self._send([("SELECT", self.db)])
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def _send(self, commands):
+        self._local.sock.sendall(b"".join(_encode_command(*cmd) for cmd in commands))
+        # Se leen todas las respuestas antes de reportar un error: si alguna quedara sin
+        # leer, la siguiente petición en esta conexión recibiría la respuesta de otra clave
+        replies, error = [], None
+        for _ in commands:
+            try:
+                replies.append(_read_reply(self._local.reader))
+            except RedisError as e:
+                error = error or e
+                replies.append(None)
+        if error is not None:
+            raise error
+        return replies
+
+    def execute(self, commands):
+        """Envía varios comandos en un solo viaje (pipeline); reintenta una vez si la conexión cayó."""
+        if time.monotonic() < self._down_until:
+            # Servidor caído hace poco: no pagar el timeout de conexión en cada petición
+            raise ConnectionError("Caché compartida no disponible")
+        for attempt in range(2):
+            try:
+                if getattr(self._local, "sock", None) is None:
+                    self._connect()
+                return self._send(commands)
+            except RedisError:
+                # Error del servidor (OOM, READONLY...): reintentar no cambia nada; se cierra
+                # la conexión por si quedó una respuesta anidada sin leer
+                self._close()
+                raise
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt == 1:
+                    self._down_until = time.monotonic() + self.retry_after
+                    raise
+            except Exception:
+                self._close()
+                raise
+
+    def _set_command(self, key, value):
+        if self.compress:
+            value = compress_value(value)
+        if self.ttl:
+            return ("SET", self.prefix + key, value, "EX", int(self.ttl))
+        return ("SET", self.prefix + key, value)
+
+    def get(self, key):
+        return decompress_value(self.execute([("GET", self.prefix + key)])[0])
+
+    def set(self, key, value):
+        self.execute([self._set_command(key, value)])
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.execute([("MGET", *[self.prefix + key for key in keys])])[0]
+        return {key: decompress_value(value) for key, value in zip(keys, values)}
+
+    def set_many(self, items):
+        if items:
+            self.execute([self._set_command(key, value) for key, value in items.items()])
+
+
+class TieredBackend:
+    """Disco local + caché compartida, con read-through y write-behind opcional."""
+
+    def __init__(self, local, remote, write_behind=False, batch_size=100):
+        self.local = local
+        self.remote = remote
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self._queue = None
+        if write_behind:
+            self._queue = queue.Queue()
+            threading.Thread(target=self._drain, name="cache-write-behind", daemon=True).start()
+
+    def get(self, key):
+        return self.get_many([key])[key]
+
+    def get_many(self, keys):
+        found = self.local.get_many(keys)
+        missing = [key for key, value in found.items() if value is None]
+        if missing:
+            try:
+                remote = self.remote.get_many(missing)
+            except Exception as e:
+                print(f"Error leyendo caché compartida: {e}")
+                remote = {}
+            fetched = {key: value for key, value in remote.items() if value is not None}
+            if fetched:
+                # Read-through: la próxima lectura ya es local
+                self.local.set_many(fetched)
+                found.update(fetched)
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        self.local.set_many(items)
+        if self._queue is not None:
+            for item in items.items():
+                self._queue.put(item)
+            return
+        try:
+            self.remote.set_many(items)
+        except Exception as e:
+            print(f"Error escribiendo caché compartida: {e}")
+
+    def flush(self):
+        """Espera a que se escriban las entradas pendientes (write-behind)."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def _drain(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.remote.set_many(dict(batch))
+            except Exception as e:
+                print(f"Error escribiendo caché compartida (write-behind): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+def backend_from_url(url, cache_dir="data/cache"):
+    """
+    Construye el backend a partir de una URL:
+        file://data/cache                                  (o vacío) -> disco local
+        redis://[:password@]host:6379/0?ttl=604800&write_behind=1   -> disco local + Redis
+    En Redis los valores se guardan comprimidos salvo con compress=0; el disco local guarda JSON plano.
+    """
+    if not url or url.startswith("file://"):
+        return LocalDiskBackend(url[len("file://"):] if url else cache_dir)
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise ValueError(f"Backend de caché no soportado: {parsed.scheme}")
+    options = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+    remote = RedisBackend(
+        host=parsed.hostname or "localhost",
+        port=parsed.port or 6379,
+        db=int(parsed.path.lstrip("/") or 0),
+        password=parsed.password,
+        ttl=int(options["ttl"]) if "ttl" in options else None,
+        compress=options.get("compress", "1") != "0",
+    )
+    return TieredBackend(LocalDiskBackend(cache_dir), remote, write_behind=options.get("write_behind") == "1")
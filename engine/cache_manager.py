@@ -1,29 +1,106 @@
 import hashlib
 import json
 import os
+import zlib
 from pathlib import Path
 
+from engine.cache_backends import backend_from_url, decompress_value
+
+# Preferences the app starts with; values equal to these are left out of cache keys
+DEFAULT_PREFERENCES = {
+    "jalav_stam": "Permitido",
+    "pesaj_tradicion": "Sefaradí (Kitniyot OK)",
+    "rigor": "Regular"
+}
+
+
+def canonical_preferences(preferences=None):
+    """Drops default values so that None, {} and the app defaults share one cache key."""
+    return {key: value for key, value in (preferences or {}).items() if DEFAULT_PREFERENCES.get(key) != value}
+
+
+def text_cache_key(text, preferences=None):
+    """Builds the bytes used as cache key for a text analysis (text + preferences)."""
+    payload = {"text": text.strip(), "preferences": canonical_preferences(preferences)}
+    return json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+
+
+def barcode_cache_key(barcode, preferences=None, source="image"):
+    """
+    Builds the bytes used as cache key for a verdict looked up by barcode (+ preferences).
+    source="image": verdict from the product photos (seals can be seen); the photo scan
+    answers with it directly. source="text": verdict from the OFF ingredient text, which
+    assumes there is no seal, so it is kept under its own key.
+    """
+    key = f"barcode:{barcode}" if source == "image" else f"barcode:{barcode}:{source}"
+    preferences = canonical_preferences(preferences)
+    if preferences:
+        key += ":" + json.dumps(preferences, sort_keys=True, ensure_ascii=False)
+    return key.encode("utf-8")
+
+
+def product_cache_key(barcode):
+    """Builds the bytes used as cache key for the OpenFoodFacts product data of a barcode."""
+    return f"product:{barcode}".encode("utf-8")
+
+
 class CacheManager:
-    def __init__(self, cache_dir="data/cache"):
+    def __init__(self, cache_dir="data/cache", backend=None):
+        """
+        backend: storage backend (engine/cache_backends.py). Defaults to the one described by
+        KASHRUT_CACHE_URL, or the local cache_dir when unset. Results are stored as JSON;
+        the Redis backend compresses them on its side, so local files stay plain JSON.
+        """
         self.cache_dir = Path(cache_dir)
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if backend is None:
+            backend = backend_from_url(os.getenv("KASHRUT_CACHE_URL"), cache_dir)
+        self.backend = backend
 
     def _get_image_hash(self, image_data):
         """Generates a SHA-256 hash for the image data."""
         return hashlib.sha256(image_data).hexdigest()
 
+    def _encode(self, result):
+        return json.dumps(result, indent=4).encode("utf-8")
+
+    def _decode(self, value):
+        if value is None:
+            return None
+        try:
+            # Entries compressed by earlier versions are still readable
+            return json.loads(decompress_value(value))
+        except (zlib.error, ValueError) as e:
+            print(f"Entrada de caché inválida: {e}")
+            return None
+
     def get_cached_result(self, image_data):
         """Retrieves cached result if it exists."""
-        img_hash = self._get_image_hash(image_data)
-        cache_file = self.cache_dir / f"{img_hash}.json"
-        if cache_file.exists():
-            with open(cache_file, "r") as f:
-                return json.load(f)
-        return None
+        try:
+            return self._decode(self.backend.get(self._get_image_hash(image_data)))
+        except Exception as e:
+            print(f"Error leyendo caché: {e}")
+            return None
 
     def save_to_cache(self, image_data, result):
-        """Saves the result to cache using the image hash as the filename."""
-        img_hash = self._get_image_hash(image_data)
-        cache_file = self.cache_dir / f"{img_hash}.json"
-        with open(cache_file, "w") as f:
-            json.dump(result, f, indent=4)
+        """Saves the result to cache using the image hash as the key."""
+        try:
+            self.backend.set(self._get_image_hash(image_data), self._encode(result))
+        except Exception as e:
+            print(f"Error escribiendo caché: {e}")
+
+    def get_many(self, keys_data):
+        """Batched lookup: returns one result (or None) per input, in order."""
+        hashes = [self._get_image_hash(data) for data in keys_data]
+        try:
+            found = self.backend.get_many(hashes)
+        except Exception as e:
+            print(f"Error leyendo caché: {e}")
+            return [None] * len(hashes)
+        return [self._decode(found.get(h)) for h in hashes]
+
+    def save_many(self, items):
+        """Batched save of (key_data, result) pairs."""
+        try:
+            self.backend.set_many({self._get_image_hash(data): self._encode(result) for data, result in items})
+        except Exception as e:
+            print(f"Error escribiendo caché: {e}")
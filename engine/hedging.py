@@ -0,0 +1,186 @@
+"""
+Peticiones cubiertas ("hedged requests") para recortar la cola de latencia.
+
+Si una llamada no ha respondido cuando se alcanza el percentil `percentile`
+de las latencias recientes, se lanza un duplicado (al mismo modelo o al de
+respaldo) y se usa la primera respuesta válida. El número de duplicados está
+limitado por `budget`: fracción de llamadas que pueden cubrirse, con una
+ráfaga máxima de `max_burst`.
+
+Las llamadas corren en un CallPool acotado. El retraso del duplicado se mide
+desde que la llamada empieza a ejecutarse (la espera en cola no cuenta) y no
+se lanzan duplicados si el pool no tiene hilos libres: bajo carga el hedging
+no agrega tráfico a la cola.
+
+La llamada perdedora no se puede interrumpir (es HTTP en otro hilo): se
+descarta su resultado, pero su costo se cuenta en `extra_calls`. El límite de
+tiempo real de cada llamada es el timeout HTTP del cliente; `timeout` aquí es
+opcional y solo deja de esperar.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class CallPool:
+    """Pool de hilos acotado que lleva la cuenta de las llamadas en curso o en cola."""
+
+    def __init__(self, max_workers, thread_name_prefix="model-call"):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def submit(self, fn):
+        with self._lock:
+            self.in_flight += 1
+        future = self._executor.submit(fn)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _):
+        with self._lock:
+            self.in_flight -= 1
+
+    def has_capacity(self):
+        with self._lock:
+            return self.in_flight < self.max_workers
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+class HedgedCaller:
+    def __init__(self, pool, percentile=95, budget=0.05, max_burst=3, min_samples=20,
+                 initial_delay=10.0, timeout=None, window=200):
+        self.pool = pool
+        self.percentile = percentile
+        self.budget = budget
+        self.max_burst = max_burst
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._tokens = float(max_burst)
+        self._latencies = deque(maxlen=window)
+        self._primary_latencies = deque(maxlen=window)
+        self._served_latencies = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self):
+        """Segundos de ejecución a esperar antes de lanzar el duplicado."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial_delay
+            return _percentile(self._latencies, self.percentile)
+
+    def call(self, primary_fn, hedge_fn):
+        """
+        Ejecuta primary_fn; si tarda más del percentil configurado, también hedge_fn.
+        Retorna (resultado, ganó_el_duplicado).
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self.max_burst, self._tokens + self.budget)
+
+        began = []
+        started = threading.Event()
+
+        def run_primary():
+            began.append(time.perf_counter())
+            started.set()
+            return primary_fn()
+
+        primary = self.pool.submit(run_primary)
+        primary.add_done_callback(lambda f: self._record_primary(f, began))
+
+        # La espera en cola no cuenta para el retraso del duplicado
+        while not started.wait(0.05) and not primary.done():
+            pass
+        delay = self.hedge_delay() - (time.perf_counter() - began[0]) if began else 0.0
+        done, _ = wait([primary], timeout=max(0.0, delay))
+        if done or not self.pool.has_capacity() or not self._take_token():
+            return self._finish(primary, start), False
+
+        hedge = self.pool.submit(hedge_fn)
+        futures = {primary, hedge}
+        last_error = None
+        while futures:
+            done, futures = wait(futures, timeout=self._remaining(start), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for other in futures:
+                        other.cancel()
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    self._record_served(start)
+                    return future.result(), future is hedge
+                last_error = future.exception()
+        if last_error is not None and not futures:
+            raise last_error
+        raise TimeoutError(f"Sin respuesta del modelo en {self.timeout:.0f}s")
+
+    def _remaining(self, start):
+        if self.timeout is None:
+            return None
+        return max(0.0, start + self.timeout - time.perf_counter())
+
+    def _finish(self, future, start):
+        try:
+            result = future.result(timeout=self._remaining(start))
+        except FutureTimeout:
+            raise TimeoutError(f"Sin respuesta del modelo en {self.timeout:.0f}s")
+        self._record_served(start)
+        return result
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+    def _record_primary(self, future, began):
+        # Se registra aunque la llamada pierda contra el duplicado: es la latencia sin cobertura
+        if not began or future.cancelled() or future.exception() is not None:
+            return
+        latency = time.perf_counter() - began[0]
+        with self._lock:
+            self._latencies.append(latency)
+            self._primary_latencies.append(latency)
+
+    def _record_served(self, start):
+        with self._lock:
+            self._served_latencies.append(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            snap = {
+                "calls": self.calls,
+                "extra_calls": self.hedges,
+                "extra_call_ratio": round(self.hedges / self.calls, 4) if self.calls else 0,
+                "hedge_wins": self.hedge_wins,
+                "hedge_delay_ms": None,
+            }
+            primary = list(self._primary_latencies)
+            served = list(self._served_latencies)
+            if len(self._latencies) >= self.min_samples:
+                snap["hedge_delay_ms"] = round(_percentile(self._latencies, self.percentile) * 1000, 1)
+        for p in (50, 95, 99):
+            # 'unhedged' es la latencia de ejecución de la llamada original por sí sola
+            snap[f"unhedged_p{p}_ms"] = round(_percentile(primary, p) * 1000, 1) if primary else None
+            snap[f"served_p{p}_ms"] = round(_percentile(served, p) * 1000, 1) if served else None
+        return snap
@@ -1,10 +1,26 @@
 import sqlite3
 import json
+import csv
+import gzip
+import os
+import threading
 from datetime import datetime
 
+EXPORT_COLUMNS = ("timestamp", "product_name", "status", "category", "details", "is_favorite")
+
 class HistoryManager:
-    def __init__(self, db_path="kashrut_history.db"):
+    def __init__(self, db_path="kashrut_history.db", cross_process=None):
         self.db_path = db_path
+        # Contador de cambios: las consultas se sirven desde memoria hasta que cambia.
+        # Con cross_process, además se comparte vía el archivo '<db>.version'
+        # para que otros procesos (workers) invaliden su copia.
+        if cross_process is None:
+            cross_process = os.getenv("KASHRUT_HISTORY_CROSS_PROCESS", "0") == "1"
+        self.cross_process = cross_process
+        self.version_path = f"{db_path}.version"
+        self._version = 0
+        self._query_cache = {}
+        self._cache_lock = threading.Lock()
         self._init_db()
 
     def _init_db(self):
@@ -21,6 +37,8 @@ class HistoryManager:
                 is_favorite INTEGER DEFAULT 0
             )
         ''')
+        # Índice usado para deduplicar al importar
+        c.execute('CREATE INDEX IF NOT EXISTS idx_scans_dedup ON scans (timestamp, product_name)')
         conn.commit()
         conn.close()
 
@@ -45,6 +63,7 @@ class HistoryManager:
         
         conn.commit()
         conn.close()
+        self._bump_version()
 
     def delete_scan(self, scan_id):
         conn = sqlite3.connect(self.db_path)
@@ -52,11 +71,20 @@ class HistoryManager:
         c.execute('DELETE FROM scans WHERE id = ?', (scan_id,))
         conn.commit()
         conn.close()
+        self._bump_version()
 
     def get_history(self, limit=50):
         """
         Recupera los últimos escaneos.
+        Mientras el historial no cambie se retorna la misma lista (no modificarla).
         """
+        key = ("get_history", limit)
+        version = self.current_version()
+        with self._cache_lock:
+            cached = self._query_cache.get(key)
+            if cached and cached[0] == version:
+                return cached[1]
+
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
         c.execute('SELECT * FROM scans ORDER BY id DESC LIMIT ?', (limit,))
@@ -74,11 +102,158 @@ class HistoryManager:
                 "details": json.loads(row[5]),
                 "is_favorite": bool(row[6])
             })
+
+        with self._cache_lock:
+            self._query_cache[key] = (version, history)
         return history
 
+    def current_version(self):
+        """Versión del historial; cambia con cada alta, baja o vaciado."""
+        if not self.cross_process:
+            return self._version
+        try:
+            stat = os.stat(self.version_path)
+            return (self._version, stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return (self._version, None, None)
+
+    def _bump_version(self):
+        with self._cache_lock:
+            self._version += 1
+            self._query_cache.clear()
+        if self.cross_process:
+            # Reemplazo atómico: cambia inodo y mtime, que es lo que comparan los demás procesos
+            tmp_path = f"{self.version_path}.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "w") as f:
+                f.write(str(self._version))
+            os.replace(tmp_path, self.version_path)
+
     def clear_history(self):
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
         c.execute('DELETE FROM scans')
         conn.commit()
         conn.close()
+        self._bump_version()
+
+    def iter_scans(self, batch_size=1000):
+        """
+        Recorre todo el historial en orden de id sin cargarlo en memoria.
+        'details' se entrega como el texto JSON guardado, sin parsear.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            c = conn.cursor()
+            c.execute('SELECT timestamp, product_name, status, category, details, is_favorite FROM scans ORDER BY id')
+            while True:
+                rows = c.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            conn.close()
+
+    def export_history(self, path, fmt=None):
+        """
+        Exporta el historial a JSONL o CSV (con '.gz' se comprime en gzip).
+        El formato se deduce de la extensión si no se indica. Retorna las filas escritas.
+        """
+        fmt = fmt or _format_from_path(path)
+        count = 0
+        with _open_text(path, "w") as f:
+            if fmt == "csv":
+                writer = csv.writer(f)
+                writer.writerow(EXPORT_COLUMNS)
+                for row in self.iter_scans():
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for timestamp, product_name, status, category, details, is_favorite in self.iter_scans():
+                    # 'details' ya es JSON válido: se inserta tal cual para no re-serializarlo
+                    f.write('{"timestamp": %s, "product_name": %s, "status": %s, "category": %s, '
+                            '"is_favorite": %s, "details": %s}\n' % (
+                                json.dumps(timestamp), json.dumps(product_name, ensure_ascii=False),
+                                json.dumps(status, ensure_ascii=False), json.dumps(category, ensure_ascii=False),
+                                "true" if is_favorite else "false", details))
+                    count += 1
+        return count
+
+    def import_history(self, path, fmt=None, batch_size=5000):
+        """
+        Importa un archivo generado por export_history en transacciones por lotes.
+        Omite escaneos que ya existen (mismo timestamp, producto y detalles).
+        Retorna (importados, omitidos).
+        """
+        fmt = fmt or _format_from_path(path)
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        before = conn.total_changes
+        total = 0
+        try:
+            with _open_text(path, "r") as f:
+                rows = _read_csv_rows(f) if fmt == "csv" else _read_jsonl_rows(f)
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        total += self._insert_batch(conn, c, batch)
+                        batch = []
+                if batch:
+                    total += self._insert_batch(conn, c, batch)
+            imported = conn.total_changes - before
+        finally:
+            conn.close()
+            self._bump_version()
+        return imported, total - imported
+
+    def _insert_batch(self, conn, c, batch):
+        c.executemany('''
+            INSERT INTO scans (timestamp, product_name, status, category, details, is_favorite)
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM scans WHERE timestamp = ? AND product_name = ? AND details = ?
+            )
+        ''', [row + (row[0], row[1], row[4]) for row in batch])
+        conn.commit()
+        return len(batch)
+
+
+def _format_from_path(path):
+    name = str(path).lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return "csv" if name.endswith(".csv") else "jsonl"
+
+
+def _open_text(path, mode):
+    if str(path).lower().endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="", compresslevel=6)
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _read_jsonl_rows(f):
+    for line in f:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        yield (
+            item.get("timestamp"),
+            item.get("product_name", "Desconocido"),
+            item.get("status", "Dudoso"),
+            item.get("category", "Desconocido"),
+            json.dumps(item.get("details", {}), ensure_ascii=False),
+            1 if item.get("is_favorite") else 0,
+        )
+
+
+def _read_csv_rows(f):
+    for item in csv.DictReader(f):
+        yield (
+            item["timestamp"],
+            item["product_name"],
+            item["status"],
+            item["category"],
+            item["details"],
+            1 if item.get("is_favorite") in ("1", "True", "true") else 0,
+        )
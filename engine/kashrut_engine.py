@@ -5,8 +5,19 @@ import google.generativeai as genai
 from PIL import Image
 from dotenv import load_dotenv
 
+from engine.hedging import CallPool, HedgedCaller
+from engine.prompt_builder import PromptBuilder
+from engine.model_router import (
+    ROUTE_ESCALATED, ROUTE_FALLBACK, ROUTE_FLASH, ROUTE_HEDGED_PRO, RouteStats, estimate_cost, is_quota_error, needs_escalation,
+    usage_tokens
+)
+from engine.replay import replay_mode, wrap_model
+
 load_dotenv()
 
+PRIMARY_MODEL = 'gemini-flash-latest'
+FALLBACK_MODEL = 'gemini-pro-latest'
+
 SYSTEM_PROMPT = """
 Rol: Actúas como un experto en certificación de alimentos Kosher ("Mashguiaj Digital") con capacidades avanzadas de visión por computadora y análisis de texto.
 
@@ -49,31 +60,97 @@ Formato JSON Estricto:
 }
 """
 
+def parse_model_json(text):
+    """
+    Convierte el texto de Gemini en dict.
+    Limpia la respuesta por si Gemini incluye tildes invertidas de markdown.
+    """
+    content = text.strip()
+    if content.startswith("```json"):
+        content = content[7:-3].strip()
+    elif content.startswith("```"):
+        content = content[3:-3].strip()
+    return json.loads(content)
+
+
+class FallbackError(Exception):
+    """Flash lanzó un error que pasa a pro (en texto, solo de cuota) y pro también falló."""
+
+    def __init__(self, message, quota=False):
+        super().__init__(message)
+        # True si el error de flash fue de cuota: quien llama puede dejar de enviar peticiones
+        self.quota = quota
+
+
 class KashrutEngine:
     def __init__(self):
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY no encontrada en las variables de entorno.")
-        genai.configure(api_key=api_key, transport='rest')
+        # En modo replay (engine/replay.py) no se contacta a Gemini
+        if replay_mode() != "replay":
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY no encontrada en las variables de entorno.")
+            genai.configure(api_key=api_key, transport='rest')
         
         # Primary model - using stable flash model
-        self.primary_model = genai.GenerativeModel('gemini-flash-latest', system_instruction=SYSTEM_PROMPT)
-        # Fallback model - using pro model
-        self.fallback_model = genai.GenerativeModel('gemini-pro-latest', system_instruction=SYSTEM_PROMPT)
+        self.primary_model = wrap_model(
+            lambda: genai.GenerativeModel(PRIMARY_MODEL, system_instruction=SYSTEM_PROMPT),
+            PRIMARY_MODEL)
+        # Fallback model - using pro model (errores y veredictos de baja confianza)
+        self.fallback_model = wrap_model(
+            lambda: genai.GenerativeModel(FALLBACK_MODEL, system_instruction=SYSTEM_PROMPT),
+            FALLBACK_MODEL)
+
+        # Confianza mínima (0-100) para aceptar el veredicto de flash sin escalar a pro
+        self.escalation_threshold = float(os.getenv("KASHRUT_ESCALATION_CONFIDENCE", "70"))
+        self.route_stats = RouteStats()
+
+        # Partes fijas de los prompts precalculadas; presupuesto de tokens para la parte variable
+        self.prompts = PromptBuilder(SYSTEM_PROMPT, int(os.getenv("KASHRUT_PROMPT_TOKEN_BUDGET", "1200")))
+
+        # Timeout HTTP de cada llamada a Gemini: libera el hilo aunque la API no responda
+        self.request_options = {"timeout": float(os.getenv("KASHRUT_CALL_TIMEOUT", "90"))}
+
+        # Hedged requests: duplicado al percentil KASHRUT_HEDGE_PERCENTILE de la latencia reciente,
+        # dirigido al mismo modelo o al de respaldo (KASHRUT_HEDGE_TARGET=same|fallback).
+        # Todas las llamadas del proceso comparten un pool de KASHRUT_MODEL_CONCURRENCY hilos
+        # (por defecto 32: 8 escaneos simultáneos de ScanPipeline x 2 análisis x 2 con duplicado);
+        # las que no caben esperan en cola y mientras esté lleno no se lanzan duplicados.
+        self.hedge_target = os.getenv("KASHRUT_HEDGE_TARGET", "same")
+        self._call_pool = CallPool(int(os.getenv("KASHRUT_MODEL_CONCURRENCY", "32")), thread_name_prefix="gemini-call")
+        hedge_options = {
+            "percentile": float(os.getenv("KASHRUT_HEDGE_PERCENTILE", "95")),
+            "budget": float(os.getenv("KASHRUT_HEDGE_BUDGET", "0.05")),
+        }
+        self.primary_hedger = HedgedCaller(self._call_pool, **hedge_options)
+        self.fallback_hedger = HedgedCaller(self._call_pool, **hedge_options)
 
     def _is_quota_error(self, error):
         """Check if the error is a quota/rate limit error."""
-        error_str = str(error).lower()
-        return '429' in error_str or 'quota' in error_str or 'rate limit' in error_str
+        return is_quota_error(error)
 
     def _try_generate_content(self, model, content_list, _unused_arg=None, max_retries=3):
         """
         Try to generate content with retry logic and exponential backoff.
+        Each attempt is hedged: a slow call gets a duplicate and the first valid response wins.
+        Returns (response, name of the model that served it).
         """
+        if model is self.primary_model:
+            hedger, name = self.primary_hedger, PRIMARY_MODEL
+            if self.hedge_target == "fallback":
+                hedge_model, hedge_name = self.fallback_model, FALLBACK_MODEL
+            else:
+                hedge_model, hedge_name = model, name
+        else:
+            hedger, name = self.fallback_hedger, FALLBACK_MODEL
+            hedge_model, hedge_name = model, name
+
         for attempt in range(max_retries):
             try:
-                response = model.generate_content(content_list)
-                return response
+                response, hedge_won = hedger.call(
+                    lambda: model.generate_content(content_list, request_options=self.request_options),
+                    lambda: hedge_model.generate_content(content_list, request_options=self.request_options)
+                )
+                return response, hedge_name if hedge_won else name
             except Exception as e:
                 # Exponential backoff
                 time.sleep(2 ** attempt)
@@ -81,6 +158,76 @@ class KashrutEngine:
                     raise e
         return None
 
+    def _log_tokens(self, model_name, estimated_tokens, tokens_in, tokens_out):
+        print(f"[tokens] {model_name}: entrada={tokens_in} (estimado {estimated_tokens}) salida={tokens_out}")
+
+    def _generate_routed(self, content, should_fallback=None, fallback_retries=3, estimated_tokens=None,
+                         escalate_dudoso=True):
+        """
+        Usa flash para todo y escala a pro solo cuando su confianza está por
+        debajo de escalation_threshold, el veredicto es 'Dudoso' (si
+        escalate_dudoso), o flash falla (si should_fallback lo permite para ese error).
+        """
+        start = time.perf_counter()
+        tokens_in = tokens_out = 0
+        cost = 0.0
+
+        result = None
+        flash_error = None
+        served_by = PRIMARY_MODEL
+        try:
+            response, served_by = self._try_generate_content(self.primary_model, content)
+            result = self._parse_response(response)
+            tokens_in, tokens_out = usage_tokens(response)
+            cost += estimate_cost(served_by, tokens_in, tokens_out)
+            self._log_tokens(served_by, estimated_tokens, tokens_in, tokens_out)
+        except Exception as e:
+            if should_fallback and not should_fallback(e):
+                raise
+            flash_error = e
+            print(f"Error con modelo primario: {e}")
+
+        if result is not None and served_by == FALLBACK_MODEL and "error" not in result:
+            # El duplicado a pro ganó: escalar otra vez a pro no aporta
+            self.route_stats.record(ROUTE_HEDGED_PRO, time.perf_counter() - start, tokens_in, tokens_out, cost)
+            return result
+        if result is not None and not needs_escalation(result, self.escalation_threshold, escalate_dudoso):
+            self.route_stats.record(ROUTE_FLASH, time.perf_counter() - start, tokens_in, tokens_out, cost)
+            return result
+
+        flash_usable = result is not None and "error" not in result
+        route = ROUTE_ESCALATED if flash_usable else ROUTE_FALLBACK
+        try:
+            response, _ = self._try_generate_content(self.fallback_model, content, max_retries=fallback_retries)
+            escalated = self._parse_response(response)
+            pro_in, pro_out = usage_tokens(response)
+            self._log_tokens(FALLBACK_MODEL, estimated_tokens, pro_in, pro_out)
+            tokens_in, tokens_out = tokens_in + pro_in, tokens_out + pro_out
+            cost += estimate_cost(FALLBACK_MODEL, pro_in, pro_out)
+        except Exception as e:
+            if not flash_usable:
+                self.route_stats.record(route, time.perf_counter() - start, tokens_in, tokens_out, cost)
+                if flash_error is None:
+                    # Flash respondió pero sin JSON válido: se reporta ese error de parseo
+                    print(f"Error con modelo de respaldo: {e}")
+                    return result
+                raise FallbackError(str(e), quota=is_quota_error(flash_error)) from e
+            print(f"Error escalando a modelo pro: {e}")
+            escalated = None
+        self.route_stats.record(route, time.perf_counter() - start, tokens_in, tokens_out, cost)
+
+        if flash_usable and (escalated is None or "error" in escalated):
+            # Pro falló: se conserva el veredicto de flash
+            return result
+        return escalated
+
+    def hedging_stats(self):
+        """Métricas de hedged requests por modelo: latencia con y sin duplicado, llamadas extra."""
+        return {
+            PRIMARY_MODEL: self.primary_hedger.snapshot(),
+            FALLBACK_MODEL: self.fallback_hedger.snapshot(),
+        }
+
     def analyze_product(self, images, extra_context=None, preferences=None):
         """
         Analiza una o varias imágenes de un producto.
@@ -89,47 +236,24 @@ class KashrutEngine:
             extra_context: Texto adicional para ayudar al análisis (ej. ingredientes de OpenFoodFacts).
             preferences: Dict con preferencias de kashrut (ej. {"jalav_stam": "strict", "kitniyot": "ashkenazi"}).
         """
-        prompt = "Analiza estas imágenes del producto. Busca sellos en el frente y revisa ingredientes al reverso."
-        
-        if extra_context:
-            prompt += f"\n\nCONTEXTO ADICIONAL (De base de datos externa):\n{extra_context}"
-            prompt += "\nUsa esta lista de ingredientes para mayor precisión si las fotos no son claras."
-
-        if preferences:
-            prompt += f"\n\nPREFERENCIAS DEL USUARIO:\n{json.dumps(preferences, ensure_ascii=False)}"
-            prompt += "\nAjusta tu veredicto según estas preferencias (ej. si el usuario es estricto en Jalav Yisrael y el producto es Jalav Stam, indícalo)."
-
-        prompt += "\nSi no se ve bien, avisa en 'alertas'."
-        
         # Ensure input is a list
         if not isinstance(images, list):
             images = [images]
 
-        content = [prompt] + images
+        built = self.prompts.image_prompt(images, extra_context=extra_context, preferences=preferences)
+        content = [built.text] + images
 
         try:
-            # Try primary model
-            response = self._try_generate_content(self.primary_model, content)
-            return self._parse_response(response)
+            return self._generate_routed(content, estimated_tokens=built.estimated_tokens)
         except Exception as e:
-            print(f"Error con modelo primario: {e}")
-            try:
-                # Try fallback model
-                response = self._try_generate_content(self.fallback_model, content)
-                return self._parse_response(response)
-            except Exception as e2:
-                return {"error": f"Error en análisis de imágenes: {str(e2)}"}
+            error = {"error": f"Error en análisis de imágenes: {str(e)}"}
+            if isinstance(e, FallbackError) and e.quota:
+                error["cuota_agotada"] = True
+            return error
 
     def _parse_response(self, response):
         try:
-            # Limpiar la respuesta por si Gemini incluye tildes invertidas de markdown
-            content = response.text.strip()
-            if content.startswith("```json"):
-                content = content[7:-3].strip()
-            elif content.startswith("```"):
-                content = content[3:-3].strip()
-                
-            return json.loads(content)
+            return parse_model_json(response.text)
         except Exception as e:
             return {
                 "error": f"Error al parsear la respuesta: {str(e)}",
@@ -140,67 +264,23 @@ class KashrutEngine:
         """
         Analiza una lista de ingredientes en texto.
         """
-        prompt = f"""
-        Analiza la siguiente lista de ingredientes y detalles del producto para determinar su estatus de Kashrut bajo estándares rigurosos (Deep Analysis).
-        
-        TEXTO DEL PRODUCTO:
-        "{text}"
-        """
-
-        if preferences:
-            prompt += f"\n\nPREFERENCIAS DEL USUARIO:\n{json.dumps(preferences, ensure_ascii=False)}"
-            prompt += "\nAjusta tu veredicto según estas preferencias."
-
-        prompt += """
-        Instrucciones especiales para texto:
-        - Si no se mencionan sellos en el texto, asume que NO tiene sello (Sello: 'Ninguno').
-        - Aplica estricta revisión de ingredientes (E-numbers, gelatina, cochinilla/carmín).
-        - Si es un producto procesado sin sello explícito, el resultado debe ser NO KOSHER o DUDOSO.
-        
-        Usa el mismo formato JSON estricto que para las imágenes:
-        {
-          "resultado": "Kosher / No Kosher / Dudoso",
-          "confianza_analisis": "0-100%",
-          "sello_detectado": "Nombre o 'Ninguno'",
-          "categoria": "Parve / Dairy / Meat / DE",
-          "alertas": ["Lista de alertas"],
-          "explicacion_halajica": "Explicación breve"
-        }
-        """
-        
-        try:
-            # Try primary model first
-            response = self._try_generate_content(self.primary_model, prompt, None) # Image is None
-            
-        except Exception as e:
-             # If quota error, try fallback model
-            if self._is_quota_error(e):
-                try:
-                    response = self._try_generate_content(self.fallback_model, prompt, None, max_retries=2)
-                except Exception as fallback_error:
-                    return {
-                        "error": "Límite de cuota de API excedido.",
-                        "estado": "Error",
-                        "detalles": str(fallback_error)
-                    }
-            else:
-                 return {
-                    "error": f"Error al procesar el texto: {str(e)}",
-                    "estado": "Error"
-                }
+        built = self.prompts.text_prompt(text, preferences=preferences)
 
         try:
-            # Clean response
-            content = response.text.strip()
-            if content.startswith("```json"):
-                content = content[7:-3].strip()
-            elif content.startswith("```"):
-                content = content[3:-3].strip()
-                
-            return json.loads(content)
+            # Errores de flash solo pasan a pro si son de cuota; 'Dudoso' es la respuesta
+            # esperada sin sello, así que solo la baja confianza escala
+            return self._generate_routed(built.text, should_fallback=self._is_quota_error, fallback_retries=2,
+                                         estimated_tokens=built.estimated_tokens, escalate_dudoso=False)
+        except FallbackError as fallback_error:
+            return {
+                "error": "Límite de cuota de API excedido.",
+                "estado": "Error",
+                "detalles": str(fallback_error),
+                "cuota_agotada": fallback_error.quota
+            }
         except Exception as e:
             return {
-                "error": f"Error al parsear la respuesta: {str(e)}",
+                "error": f"Error al procesar el texto: {str(e)}",
                 "estado": "Error"
             }
 
@@ -212,7 +292,7 @@ class KashrutEngine:
         
         try:
             # We use flash for speed
-            response = self.primary_model.generate_content([prompt, image])
+            response = self.primary_model.generate_content([prompt, image], request_options=self.request_options)
             text = response.text.strip().replace(" ", "").replace("\n", "")
             # Filter only digits
             digits = "".join(filter(str.isdigit, text))
@@ -0,0 +1,101 @@
+"""
+Criterio de escalamiento flash -> pro y métricas por ruta.
+
+Todas las peticiones pasan primero por el modelo rápido; solo se escalan al
+modelo pro cuando la respuesta es de baja confianza (o dudosa, en el análisis
+de fotos) o cuando flash falla. RouteStats acumula latencia, tokens y costo estimado por ruta.
+"""
+import re
+import threading
+from collections import deque
+
+# Precios de lista aproximados en USD por millón de tokens (entrada, salida).
+# Ajustar según la facturación real del proyecto.
+MODEL_PRICING = {
+    "gemini-flash-latest": (0.30, 2.50),
+    "gemini-pro-latest": (1.25, 10.00),
+}
+
+ROUTE_FLASH = "flash"
+ROUTE_ESCALATED = "flash+pro"
+ROUTE_FALLBACK = "pro_fallback"
+# Petición a flash respondida por el duplicado a pro (KASHRUT_HEDGE_TARGET=fallback)
+ROUTE_HEDGED_PRO = "pro_hedge"
+
+
+def parse_confidence(value):
+    """'85%' -> 85. Retorna None si no hay un número reconocible."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d+(?:[.,]\d+)?", str(value or ""))
+    return float(match.group().replace(",", ".")) if match else None
+
+
+def needs_escalation(result, threshold, escalate_dudoso=True):
+    """
+    True si la confianza está por debajo del umbral o, con escalate_dudoso,
+    si el veredicto es 'Dudoso'. El prompt de texto exige 'Dudoso' para todo
+    producto procesado sin sello, así que ahí solo cuenta la confianza.
+    """
+    if not result or "error" in result:
+        return True
+    if escalate_dudoso and "dudoso" in str(result.get("resultado", "")).lower():
+        return True
+    confidence = parse_confidence(result.get("confianza_analisis"))
+    return confidence is not None and confidence < threshold
+
+
+def is_quota_error(error):
+    """True si el error (excepción o mensaje) es de cuota o límite de tasa de la API."""
+    error_str = str(error).lower()
+    return '429' in error_str or 'quota' in error_str or 'rate limit' in error_str
+
+
+def usage_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0
+
+
+def estimate_cost(model_name, input_tokens, output_tokens):
+    price_in, price_out = MODEL_PRICING.get(model_name, (0.0, 0.0))
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+class RouteStats:
+    """Contadores por ruta: llamadas, latencia de extremo a extremo, tokens y costo."""
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self._window = window
+        self._routes = {}
+
+    def record(self, route, latency, input_tokens=0, output_tokens=0, cost=0.0):
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                "calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0,
+                "latencies": deque(maxlen=self._window),
+            })
+            stats["calls"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost_usd"] += cost
+            stats["latencies"].append(latency)
+
+    def snapshot(self):
+        with self._lock:
+            snap = {}
+            total = sum(stats["calls"] for stats in self._routes.values())
+            for route, stats in self._routes.items():
+                latencies = sorted(stats["latencies"])
+                snap[route] = {
+                    "calls": stats["calls"],
+                    "share": round(stats["calls"] / total, 3) if total else 0,
+                    "input_tokens": stats["input_tokens"],
+                    "output_tokens": stats["output_tokens"],
+                    "cost_usd": round(stats["cost_usd"], 6),
+                    "avg_latency_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+                    "p95_latency_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1) if latencies else None,
+                }
+            return snap
@@ -1,7 +1,21 @@
 import requests
 
+from engine.replay import wrap_http
+
+# Valor de 'ingredients_text' cuando OFF no tiene la lista de ingredientes
+NO_INGREDIENTS = 'Ingredientes no disponibles'
+
+
+def ingredients_of(product):
+    """Texto de ingredientes de un producto de get_product, o None si OFF no lo tiene."""
+    text = (product or {}).get("ingredients_text")
+    return text if text and text != NO_INGREDIENTS else None
+
+
 class OpenFoodFactsClient:
     def __init__(self):
+        # requests, o su versión que graba / reproduce (engine/replay.py)
+        self.http = wrap_http(requests)
         self.base_url = "https://world.openfoodfacts.org/api/v2/product/"
         self.headers = {
             "User-Agent": "KashrutApp/1.0 (tescaelements@example.com) - Digital Mashgiach"
@@ -17,7 +31,7 @@ class OpenFoodFactsClient:
 
         try:
             url = f"{self.base_url}{barcode}.json"
-            response = requests.get(url, headers=self.headers, timeout=5)
+            response = self.http.get(url, headers=self.headers, timeout=5)
             
             if response.status_code == 200:
                 data = response.json()
@@ -25,7 +39,7 @@ class OpenFoodFactsClient:
                     product = data.get('product', {})
                     return {
                         "product_name": product.get('product_name', 'Nombre no disponible'),
-                        "ingredients_text": product.get('ingredients_text_es') or product.get('ingredients_text', 'Ingredientes no disponibles'),
+                        "ingredients_text": product.get('ingredients_text_es') or product.get('ingredients_text', NO_INGREDIENTS),
                         "brands": product.get('brands', ''),
                         "image_url": product.get('image_front_url', '')
                     }
@@ -0,0 +1,195 @@
+"""
+Precalcula veredictos para una lista de productos y los guarda en CacheManager.
+
+Pensado para correr programado (cron) fuera de hora pico:
+    python -m engine.precompute productos.jsonl --rate 0.5 --max-calls 500
+
+Cada línea del archivo es un JSON con:
+    {"barcode": "7501...", "ingredients_text": "...", "images": ["a.jpg", "b.jpg"], "popularity": 120}
+Todos los campos son opcionales salvo que haya al menos barcode, texto o imágenes.
+Si solo hay código de barras, los ingredientes se buscan en OpenFoodFacts.
+
+El trabajo es reanudable: los productos que ya están en caché se omiten sin
+llamar al modelo, así que basta con volver a ejecutarlo tras cortar la cuota.
+"""
+import argparse
+import json
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from engine.cache_manager import (
+    DEFAULT_PREFERENCES, CacheManager, barcode_cache_key, product_cache_key, text_cache_key
+)
+from engine.model_router import is_quota_error
+from engine.off_client import OpenFoodFactsClient, ingredients_of
+
+
+class CacheWarmer:
+    """
+    Llena la caché de veredictos respetando una tasa máxima de llamadas
+    (`rate`, llamadas por segundo) y un tope de cuota (`max_calls`).
+    Qué productos ya están en caché se consulta por lotes de `batch_size`.
+    """
+
+    def __init__(self, engine, cache=None, off_client=None, rate=1.0, max_calls=None, preferences=None,
+                 batch_size=100):
+        self.engine = engine
+        self.cache = cache or CacheManager()
+        self.off_client = off_client or OpenFoodFactsClient()
+        self.min_interval = 1.0 / rate if rate > 0 else 0.0
+        self.max_calls = max_calls
+        # Por defecto, las mismas preferencias con las que arranca la app
+        self.preferences = dict(DEFAULT_PREFERENCES, **(preferences or {}))
+        self.batch_size = batch_size
+        self.calls = 0
+        self._last_call = 0.0
+
+    def run(self, products):
+        """Procesa los productos de más a menos popular y retorna un reporte de cobertura."""
+        ordered = sorted(products, key=lambda p: p.get("popularity", 0), reverse=True)
+        report = {"total": len(ordered), "already_cached": 0, "warmed": 0, "failed": 0, "pending": 0,
+                  "popularity_total": 0, "popularity_covered": 0}
+
+        for start in range(0, len(ordered), self.batch_size):
+            batch = ordered[start:start + self.batch_size]
+            for product, status in zip(batch, self._warm_batch(batch)):
+                popularity = product.get("popularity", 0)
+                report["popularity_total"] += popularity
+                if status in ("already_cached", "warmed"):
+                    report["popularity_covered"] += popularity
+                report[status] += 1
+
+        covered = report["already_cached"] + report["warmed"]
+        report["coverage"] = covered / report["total"] if report["total"] else 1.0
+        report["popularity_coverage"] = (report["popularity_covered"] / report["popularity_total"]
+                                         if report["popularity_total"] else report["coverage"])
+        report["model_calls"] = self.calls
+        return report
+
+    def _warm_batch(self, products):
+        """Una sola lectura de la caché (get_many) por lote; luego calcula los que faltan."""
+        keyed = [(product, self._keys(product)) for product in products]
+        lookup = [key for _, keys in keyed if keys for key in keys]
+        found = dict(zip(lookup, self.cache.get_many(lookup))) if lookup else {}
+        for product, keys in keyed:
+            if keys is None:
+                yield "failed"
+            elif keys and all(found.get(key) for key in keys):
+                yield "already_cached"
+            else:
+                yield self._warm(product, keys)
+
+    def _keys(self, product):
+        """Claves de caché del producto, o None si no se pudieron leer sus imágenes."""
+        barcode = product.get("barcode")
+        images = product.get("images") or []
+        text = product.get("ingredients_text")
+        keys = []
+        try:
+            if barcode:
+                # Solo el análisis de fotos puede ver sellos: el de texto va a su propia clave
+                keys.append(barcode_cache_key(barcode, self.preferences, source="image" if images else "text"))
+            if images:
+                keys.append(self._images_key(images))
+            elif text:
+                keys.append(text_cache_key(text, self.preferences))
+        except OSError as e:
+            print(f"Error leyendo imágenes de {barcode or images}: {e}")
+            return None
+        return keys
+
+    def _warm(self, product, keys):
+        barcode = product.get("barcode")
+        images = product.get("images") or []
+        text = product.get("ingredients_text")
+        label = barcode or images or (text or "")[:30]
+
+        if self.max_calls is not None and self.calls >= self.max_calls:
+            return "pending"
+
+        if not images and not text and barcode:
+            off_data = self.off_client.get_product(barcode)
+            text = ingredients_of(off_data)
+            if not text:
+                # Sin producto o sin lista de ingredientes en OFF: no hay qué analizar
+                return "failed"
+            # El servicio responde /barcode con el producto junto al veredicto
+            self.cache.save_to_cache(product_cache_key(barcode), off_data)
+            keys = keys + [text_cache_key(text, self.preferences)]
+
+        self._throttle()
+        pil_images = []
+        try:
+            if images:
+                for path in images:
+                    pil_images.append(Image.open(path))
+                result = self.engine.analyze_product(pil_images, extra_context=text, preferences=self.preferences)
+            else:
+                result = self.engine.analyze_text(text, preferences=self.preferences)
+        except Exception as e:
+            print(f"Error precalculando {label}: {e}")
+            if is_quota_error(e):
+                self._stop_for_quota()
+            return "failed"
+        finally:
+            for image in pil_images:
+                image.close()
+
+        if not result or "error" in result:
+            if result and result.get("cuota_agotada"):
+                self._stop_for_quota()
+            return "failed"
+        self.cache.save_many([(key, result) for key in keys])
+        return "warmed"
+
+    def _stop_for_quota(self):
+        # Cuota agotada: el resto queda pendiente para la próxima ejecución
+        self.max_calls = self.calls
+
+    def _images_key(self, paths):
+        # Mismo criterio que ui/app.py: bytes concatenados de todas las fotos
+        data = BytesIO()
+        for path in paths:
+            with open(path, "rb") as f:
+                data.write(f.read())
+        return data.getvalue()
+
+    def _throttle(self):
+        wait = self._last_call + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_call = time.monotonic()
+        self.calls += 1
+
+
+def load_products(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcula veredictos en la caché")
+    parser.add_argument("products", help="Archivo JSONL con la lista de productos")
+    parser.add_argument("--rate", type=float, default=0.5, help="Llamadas al modelo por segundo")
+    parser.add_argument("--max-calls", type=int, default=None, help="Tope de llamadas por ejecución (cuota)")
+    parser.add_argument("--cache-dir", default="data/cache")
+    parser.add_argument("--preferences", default=None, help="Preferencias en JSON (sobre las de la app)")
+    args = parser.parse_args()
+
+    from engine.kashrut_engine import KashrutEngine
+
+    warmer = CacheWarmer(
+        KashrutEngine(),
+        cache=CacheManager(args.cache_dir),
+        rate=args.rate,
+        max_calls=args.max_calls,
+        preferences=json.loads(args.preferences) if args.preferences else None,
+    )
+    report = warmer.run(load_products(args.products))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
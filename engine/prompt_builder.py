@@ -0,0 +1,216 @@
+"""
+Construcción de prompts con presupuesto de tokens.
+
+Las partes fijas de cada prompt se arman una sola vez al importar el módulo;
+por petición solo se agregan el contexto de OpenFoodFacts, las preferencias
+y el texto del producto. Si la parte variable excede `token_budget`, la lista
+de ingredientes de OpenFoodFacts se compacta: se eliminan duplicados y, si aún
+no cabe, se conservan primero los Aditivos Críticos, luego los ingredientes
+sensibles y después los primeros de la lista, y se indica cuántos se omitieron
+(el aviso cuenta dentro del presupuesto). Las preferencias tienen su propio tope
+(`preferences_budget`). El texto que envía el usuario nunca se recorta: su
+veredicto se guarda en caché bajo ese texto completo.
+
+Los tokens se estiman localmente (sin llamar a la API) con una aproximación
+por caracteres; sirve para limitar el tamaño, no para facturar.
+"""
+import json
+import re
+from collections import namedtuple
+
+# Promedio aproximado de caracteres por token para texto en español
+CHARS_PER_TOKEN = 3.6
+# Gemini cobra las imágenes por bloques de 768x768 px, 258 tokens cada uno
+IMAGE_TILE_TOKENS = 258
+IMAGE_TILE_SIZE = 768
+
+# Aditivos Críticos de SYSTEM_PROMPT: lo último que se descarta al recortar el contexto
+CRITICAL_ADDITIVES = (
+    "gelatin", "grenetina", "carmín", "carmin", "cochinilla", "e120", "e441", "e471", "e472", "e422",
+    "e904", "e920", "glicerina", "glycerin", "glicerol", "monoglic", "diglic", "mono y diglic",
+    "mono- y diglic", "cisteína", "cisteina", "cysteine", "emulsific", "emulsifier", "emulgente",
+    "lecitina", "lecithin", "e322", "shellac", "goma laca", "cuajo", "rennet",
+)
+# Ingredientes sensibles de alcance más amplio: se conservan después de los aditivos críticos
+CRITICAL_INGREDIENTS = (
+    "aroma", "sabor", "flavo", "e627", "e631", "e635", "guanilato", "inosinato",
+    "leche", "lácte", "lacte", "milk", "suero", "whey", "caseín", "casein", "lactosa", "mantequilla",
+    "manteca", "lard", "grasa animal", "cerdo", "pork", "vino", "wine", "uva", "grape",
+    "trigo", "wheat", "cebada", "barley", "malta", "malt",
+)
+
+
+def _terms_pattern(terms):
+    # Coincidencia al inicio de palabra; los E-numbers además deben terminar ahí ("e120" no es "e1200")
+    parts = [re.escape(term) + (r"\b" if term[-1].isdigit() else "") for term in terms]
+    return re.compile(r"\b(?:" + "|".join(parts) + ")")
+
+
+_CRITICAL_ADDITIVES_RE = _terms_pattern(CRITICAL_ADDITIVES)
+_CRITICAL_INGREDIENTS_RE = _terms_pattern(CRITICAL_INGREDIENTS)
+OMITTED_SUFFIX = " (… {} ingredientes omitidos)"
+CUT_SUFFIX = " (…)"
+
+IMAGE_INTRO = "Analiza estas imágenes del producto. Busca sellos en el frente y revisa ingredientes al reverso."
+IMAGE_CONTEXT = (
+    "\n\nCONTEXTO ADICIONAL (De base de datos externa):\n{context}"
+    "\nUsa esta lista de ingredientes para mayor precisión si las fotos no son claras."
+)
+IMAGE_PREFERENCES = (
+    "\n\nPREFERENCIAS DEL USUARIO:\n{preferences}"
+    "\nAjusta tu veredicto según estas preferencias (ej. si el usuario es estricto en Jalav Yisrael "
+    "y el producto es Jalav Stam, indícalo)."
+)
+IMAGE_OUTRO = "\nSi no se ve bien, avisa en 'alertas'."
+
+TEXT_INTRO = (
+    "Analiza la siguiente lista de ingredientes y detalles del producto para determinar su estatus "
+    "de Kashrut bajo estándares rigurosos (Deep Analysis).\n\nTEXTO DEL PRODUCTO:\n\"{text}\""
+)
+TEXT_PREFERENCES = "\n\nPREFERENCIAS DEL USUARIO:\n{preferences}\nAjusta tu veredicto según estas preferencias."
+# El esquema JSON ya está en SYSTEM_PROMPT: no se repite en cada petición
+TEXT_OUTRO = (
+    "\n\nInstrucciones especiales para texto:"
+    "\n- Si no se mencionan sellos en el texto, asume que NO tiene sello (Sello: 'Ninguno')."
+    "\n- Aplica estricta revisión de ingredientes (E-numbers, gelatina, cochinilla/carmín)."
+    "\n- Si es un producto procesado sin sello explícito, el resultado debe ser NO KOSHER o DUDOSO."
+    "\nResponde con el formato JSON estricto de tus instrucciones."
+)
+
+BuiltPrompt = namedtuple("BuiltPrompt", ["text", "estimated_tokens", "trimmed"])
+
+
+def estimate_tokens(text):
+    """Estimación local de tokens de un texto."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1 if text else 0
+
+
+def estimate_image_tokens(image):
+    tiles_x = -(-image.width // IMAGE_TILE_SIZE)
+    tiles_y = -(-image.height // IMAGE_TILE_SIZE)
+    return max(1, tiles_x * tiles_y) * IMAGE_TILE_TOKENS
+
+
+def _to_json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_preferences(preferences, max_tokens):
+    """
+    Preferencias en JSON compacto, limitadas a max_tokens: se descartan las
+    entradas que no caben. Retorna (texto, recortado).
+    """
+    full = _to_json(preferences)
+    if estimate_tokens(full) <= max_tokens:
+        return full, False
+    if not isinstance(preferences, dict):
+        return full[:int(max_tokens * CHARS_PER_TOKEN)], True
+    kept = {}
+    for key, value in preferences.items():
+        candidate = dict(kept, **{key: value})
+        if estimate_tokens(_to_json(candidate)) <= max_tokens:
+            kept = candidate
+    return _to_json(kept), True
+
+
+def _split_top_level(text):
+    """Separa por comas y punto y coma fuera de paréntesis: 'chocolate (azúcar, cacao)' queda entero."""
+    items, current, depth = [], [], 0
+    for char in text:
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth = max(0, depth - 1)
+        if char in ",;" and depth == 0:
+            items.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    items.append("".join(current))
+    return [item.strip() for item in items]
+
+
+def compact_ingredients(text, max_tokens):
+    """
+    Reduce una lista de ingredientes a max_tokens.
+    Retorna (texto, recortado).
+    """
+    normalized = re.sub(r"\s+", " ", text).strip()
+    if estimate_tokens(normalized) <= max_tokens:
+        return normalized, False
+
+    seen = set()
+    items = []
+    for item in _split_top_level(normalized):
+        key = item.lower().strip(" .")
+        if key and key not in seen:
+            seen.add(key)
+            items.append(item.strip())
+    deduped = ", ".join(items)
+    if estimate_tokens(deduped) <= max_tokens:
+        return deduped, True
+
+    # Se reserva el sufijo (con el mayor conteo posible) para que el total no exceda max_tokens
+    reserve = OMITTED_SUFFIX.format(len(items))
+    kept = set()
+    kept_items = []
+    for index in sorted(range(len(items)), key=lambda i: (_ingredient_rank(items[i]), i)):
+        if estimate_tokens(", ".join(kept_items + [items[index]]) + reserve) <= max_tokens:
+            kept.add(index)
+            kept_items.append(items[index])
+    if not kept:
+        # Ni un ingrediente cabe (o es una descripción libre): se corta por longitud
+        limit = max(0, int((max_tokens - 1) * CHARS_PER_TOKEN) - len(CUT_SUFFIX))
+        return normalized[:limit].rstrip() + CUT_SUFFIX, True
+    # Conservar el orden original de la etiqueta
+    ordered = [item for index, item in enumerate(items) if index in kept]
+    return ", ".join(ordered) + OMITTED_SUFFIX.format(len(items) - len(ordered)), True
+
+
+def _ingredient_rank(item):
+    """0: aditivo crítico, 1: ingrediente sensible, 2: el resto."""
+    lowered = re.sub(r"\be[\s-]+(?=\d)", "e", item.lower())
+    if _CRITICAL_ADDITIVES_RE.search(lowered):
+        return 0
+    if _CRITICAL_INGREDIENTS_RE.search(lowered):
+        return 1
+    return 2
+
+
+class PromptBuilder:
+    """
+    Arma los prompts de análisis y estima su tamaño.
+    `token_budget` limita la parte variable del prompt (sin instrucciones del sistema ni imágenes);
+    `preferences_budget` limita las preferencias, que envía el cliente sin restricciones.
+    """
+
+    def __init__(self, system_prompt, token_budget=1200, preferences_budget=150):
+        self.token_budget = token_budget
+        self.preferences_budget = preferences_budget
+        self.system_tokens = estimate_tokens(system_prompt)
+        self._image_fixed_tokens = estimate_tokens(IMAGE_INTRO + IMAGE_OUTRO)
+        self._text_fixed_tokens = estimate_tokens(TEXT_INTRO + TEXT_OUTRO)
+
+    def _preferences_part(self, template, preferences):
+        if not preferences:
+            return "", False
+        text, trimmed = compact_preferences(preferences, self.preferences_budget)
+        return template.format(preferences=text), trimmed
+
+    def image_prompt(self, images, extra_context=None, preferences=None):
+        prompt = IMAGE_INTRO
+        prefs_part, trimmed = self._preferences_part(IMAGE_PREFERENCES, preferences)
+        if extra_context:
+            available = self.token_budget - self._image_fixed_tokens - estimate_tokens(prefs_part + IMAGE_CONTEXT)
+            context, context_trimmed = compact_ingredients(extra_context, max(available, 0))
+            prompt += IMAGE_CONTEXT.format(context=context)
+            trimmed = trimmed or context_trimmed
+        prompt += prefs_part + IMAGE_OUTRO
+
+        image_tokens = sum(estimate_image_tokens(image) for image in images)
+        return BuiltPrompt(prompt, self.system_tokens + estimate_tokens(prompt) + image_tokens, trimmed)
+
+    def text_prompt(self, text, preferences=None):
+        prefs_part, trimmed = self._preferences_part(TEXT_PREFERENCES, preferences)
+        prompt = TEXT_INTRO.format(text=text) + prefs_part + TEXT_OUTRO
+        return BuiltPrompt(prompt, self.system_tokens + estimate_tokens(prompt), trimmed)
@@ -0,0 +1,444 @@
+"""
+Grabación y reproducción de tráfico hacia Gemini y OpenFoodFacts.
+
+En modo 'record' cada llamada real se guarda en un cassette (JSONL con gzip):
+huella de la petición, respuesta (o error) y latencia medida. También se
+graban las peticiones entrantes (escaneos del servicio y de la app) con sus
+datos, para poder re-ejecutarlas. En modo 'replay' las llamadas a Gemini y
+OpenFoodFacts se sirven desde el cassette, con la latencia original
+multiplicada por `scale`, sin tocar servicios externos.
+
+Se activa por variables de entorno, sin cambiar la app ni el servicio:
+    KASHRUT_CASSETTE=data/prod.jsonl.gz
+    KASHRUT_CASSETTE_MODE=record | replay
+    KASHRUT_REPLAY_SCALE=1.0          # 0 = sin espera, 0.5 = el doble de rápido
+
+Para comparar rendimiento, los escaneos grabados se re-ejecutan como carga a
+través de ScanService / ScanPipeline (caché, pools y parseo actuales):
+    python -m engine.replay data/prod.jsonl.gz --concurrency 8 --scale 1.0
+"""
+import argparse
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from io import BytesIO
+from types import SimpleNamespace
+
+from PIL import Image
+
+
+class CassetteMiss(Exception):
+    """La petición no está en el cassette."""
+
+
+class ReplayedError(Exception):
+    """Error grabado de la llamada original (se re-lanza con el mismo mensaje)."""
+
+
+def image_digest(image):
+    return hashlib.sha256(f"{image.mode}{image.size}".encode() + image.tobytes()).hexdigest()
+
+
+def _content_parts(content):
+    parts = content if isinstance(content, list) else [content]
+    described = []
+    for part in parts:
+        if isinstance(part, str):
+            described.append({"text": part})
+        elif isinstance(part, Image.Image):
+            described.append({"image": image_digest(part)})
+        else:
+            described.append({"bytes": hashlib.sha256(bytes(part)).hexdigest()})
+    return described
+
+
+def fingerprint(kind, target, parts):
+    payload = json.dumps([kind, target, parts], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Archivo de interacciones grabadas; las huellas repetidas se sirven en orden."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = defaultdict(deque)
+        self._started = time.time()
+        # Al agregar a un cassette existente, los instantes continúan tras la última entrada
+        self._offset = 0.0
+        self._writer = None
+        self.entries = []
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.append(entry)
+                        self._entries[entry["fp"]].append(entry)
+                        self._offset = max(self._offset, entry.get("at", 0.0))
+        except (EOFError, json.JSONDecodeError):
+            # Grabación interrumpida: se conserva todo lo que se alcanzó a escribir
+            pass
+
+    def record(self, entry):
+        entry["at"] = round(self._offset + time.time() - self._started, 4)
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._writer is None:
+                self._writer = gzip.open(self.path, "at", encoding="utf-8")
+                atexit.register(self.close)
+            self._writer.write(line)
+            # flush hace un sync flush de zlib: lo escrito es legible aunque el proceso muera
+            self._writer.flush()
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def take(self, fp):
+        with self._lock:
+            queue = self._entries.get(fp)
+            if not queue:
+                raise CassetteMiss(f"Petición no grabada en {self.path} ({fp[:12]})")
+            entry = queue.popleft()
+            if not queue:
+                # La última respuesta se reutiliza si la petición vuelve a llegar
+                queue.append(entry)
+            return entry
+
+
+class RecordingModel:
+    """Envuelve un GenerativeModel y graba cada generate_content."""
+
+    def __init__(self, model, name, cassette):
+        self.model = model
+        self.name = name
+        self.cassette = cassette
+
+    def generate_content(self, content, **kwargs):
+        parts = _content_parts(content)
+        entry = {"kind": "model", "target": self.name, "fp": fingerprint("model", self.name, parts)}
+        start = time.perf_counter()
+        try:
+            response = self.model.generate_content(content, **kwargs)
+        except Exception as e:
+            entry.update(latency=time.perf_counter() - start, error=str(e))
+            self.cassette.record(entry)
+            raise
+        entry["latency"] = time.perf_counter() - start
+        try:
+            entry["text"] = response.text
+        except Exception as e:
+            # Respuesta bloqueada o vacía: el error se reproduce al leer .text, igual que en vivo
+            entry["text_error"] = str(e)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            entry["usage"] = {"prompt_token_count": getattr(usage, "prompt_token_count", 0),
+                              "candidates_token_count": getattr(usage, "candidates_token_count", 0)}
+        self.cassette.record(entry)
+        return response
+
+
+class ReplayModel:
+    """Sirve generate_content desde el cassette con la latencia grabada × scale."""
+
+    def __init__(self, name, cassette, scale=1.0):
+        self.name = name
+        self.cassette = cassette
+        self.scale = scale
+
+    def generate_content(self, content, **kwargs):
+        entry = self.cassette.take(fingerprint("model", self.name, _content_parts(content)))
+        return _serve_model_entry(entry, self.scale)
+
+
+class ReplayedResponse:
+    def __init__(self, entry):
+        self._entry = entry
+        self.usage_metadata = SimpleNamespace(**entry["usage"]) if "usage" in entry else None
+
+    @property
+    def text(self):
+        if "text_error" in self._entry:
+            raise ValueError(self._entry["text_error"])
+        return self._entry["text"]
+
+
+def _serve_model_entry(entry, scale):
+    if scale:
+        time.sleep(entry["latency"] * scale)
+    if "error" in entry:
+        raise ReplayedError(entry["error"])
+    return ReplayedResponse(entry)
+
+
+class RecordingHttp:
+    """Sustituye al módulo requests en OpenFoodFactsClient y graba cada GET."""
+
+    def __init__(self, http, cassette):
+        self.http = http
+        self.cassette = cassette
+
+    def get(self, url, **kwargs):
+        entry = {"kind": "http", "target": url, "fp": fingerprint("http", url, [])}
+        start = time.perf_counter()
+        try:
+            response = self.http.get(url, **kwargs)
+        except Exception as e:
+            entry.update(latency=time.perf_counter() - start, error=str(e))
+            self.cassette.record(entry)
+            raise
+        entry["latency"] = time.perf_counter() - start
+        entry["status_code"] = response.status_code
+        try:
+            entry["body"] = _compact_off_body(response.json())
+        except ValueError:
+            entry["body"] = None
+        self.cassette.record(entry)
+        return response
+
+
+OFF_PRODUCT_FIELDS = ("product_name", "ingredients_text_es", "ingredients_text", "brands", "image_front_url")
+
+
+def _compact_off_body(body):
+    """Conserva solo los campos de OpenFoodFacts que lee OpenFoodFactsClient."""
+    if not isinstance(body, dict):
+        return body
+    product = body.get("product") or {}
+    return {"status": body.get("status"),
+            "product": {key: product[key] for key in OFF_PRODUCT_FIELDS if key in product}}
+
+
+class ReplayedHttpResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("Respuesta grabada sin JSON")
+        return self._body
+
+
+class ReplayHttp:
+    def __init__(self, cassette, scale=1.0):
+        self.cassette = cassette
+        self.scale = scale
+
+    def get(self, url, **kwargs):
+        return _serve_http_entry(self.cassette.take(fingerprint("http", url, [])), self.scale)
+
+
+def _serve_http_entry(entry, scale):
+    if scale:
+        time.sleep(entry["latency"] * scale)
+    if "error" in entry:
+        raise ReplayedError(entry["error"])
+    return ReplayedHttpResponse(entry["status_code"], entry["body"])
+
+
+# --- Configuración por entorno ---
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def replay_mode():
+    """'record', 'replay' o None según KASHRUT_CASSETTE / KASHRUT_CASSETTE_MODE."""
+    if not os.getenv("KASHRUT_CASSETTE"):
+        return None
+    mode = os.getenv("KASHRUT_CASSETTE_MODE", "replay").lower()
+    return mode if mode in ("record", "replay") else None
+
+
+def _cassette():
+    path = os.getenv("KASHRUT_CASSETTE")
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def _scale():
+    return float(os.getenv("KASHRUT_REPLAY_SCALE", "1.0"))
+
+
+def wrap_model(model_factory, name):
+    """Retorna el modelo real, uno que graba, o uno reproducido según el modo."""
+    mode = replay_mode()
+    if mode == "replay":
+        return ReplayModel(name, _cassette(), _scale())
+    model = model_factory()
+    return RecordingModel(model, name, _cassette()) if mode == "record" else model
+
+
+def wrap_http(http):
+    mode = replay_mode()
+    if mode == "replay":
+        return ReplayHttp(_cassette(), _scale())
+    return RecordingHttp(http, _cassette()) if mode == "record" else http
+
+
+def record_scan(op, images=None, key=None, **fields):
+    """
+    Graba una petición entrante (solo en modo record).
+    images: bytes originales o PIL.Image (se guardan en PNG, sin pérdida, para que
+    las huellas de las llamadas al modelo coincidan al re-ejecutar).
+    key: clave de caché en bytes; se guarda solo su hash.
+    """
+    if replay_mode() != "record":
+        return
+    entry = {"kind": "scan", "op": op, "fp": fingerprint("scan", op, []), **fields}
+    try:
+        if images is not None:
+            entry["images"] = [base64.b64encode(_image_bytes(image)).decode("ascii") for image in images]
+        if key is not None:
+            entry["key"] = hashlib.sha256(key).hexdigest()
+        _cassette().record(entry)
+    except Exception as e:
+        print(f"Error grabando petición entrante: {e}")
+
+
+def _image_bytes(image):
+    if isinstance(image, Image.Image):
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    return bytes(image)
+
+
+# --- Re-ejecución del cassette como carga ---
+
+def replay_traffic(entries, service=None, pipeline=None, concurrency=4, scale=1.0, keep_arrivals=True):
+    """
+    Re-ejecuta los escaneos grabados con `concurrency` clientes: los del servicio
+    pasan por la admisión y el pool de `service` (ScanService), los de la app por
+    `pipeline` (ScanPipeline). Con keep_arrivals cada escaneo llega en su instante
+    original (× scale). Retorna throughput y percentiles de latencia de extremo a extremo.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from service.scan_service import ServiceSaturated
+
+    scans = sorted((entry for entry in entries if entry["kind"] == "scan"), key=lambda e: e.get("at", 0.0))
+    latencies = []
+    counts = {"errors": 0, "rejected": 0}
+    lock = threading.Lock()
+
+    def run(entry):
+        start = time.perf_counter()
+        outcome = None
+        try:
+            result = _dispatch(entry, service, pipeline)
+            if not result or "error" in result:
+                outcome = "errors"
+        except ServiceSaturated:
+            outcome = "rejected"
+        except Exception as e:
+            print(f"Error re-ejecutando {entry['op']}: {e}")
+            outcome = "errors"
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            if outcome:
+                counts[outcome] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        first_at = scans[0].get("at", 0.0) if scans else 0.0
+        for entry in scans:
+            if keep_arrivals and scale:
+                delay = (entry.get("at", 0.0) - first_at) * scale - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            clients.submit(run, entry)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    report = {"scans": len(latencies), **counts, "elapsed_s": round(elapsed, 2),
+              "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else None}
+    for p in (50, 95, 99):
+        if latencies:
+            index = min(len(latencies) - 1, int(p / 100 * len(latencies)))
+            report[f"p{p}_ms"] = round(latencies[index] * 1000, 1)
+    return report
+
+
+def _dispatch(entry, service, pipeline):
+    op = entry["op"]
+    preferences = entry.get("preferences")
+    images = [base64.b64decode(data) for data in entry.get("images", [])]
+    if op == "photos":
+        result, _ = pipeline.scan([Image.open(BytesIO(data)) for data in images], entry["key"].encode("ascii"),
+                                  preferences=preferences)
+        return result
+    service.try_admit()
+    if op == "image":
+        result, _ = service.run(service.scan_image, images[0], preferences)
+    elif op == "text":
+        result, _ = service.run(service.scan_text, entry["text"], preferences)
+    else:
+        data = service.run(service.lookup_barcode, entry["barcode"], entry.get("analyze", False), preferences)
+        result = data.get("result", data.get("product")) if data else {"error": "Producto no encontrado."}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-ejecuta los escaneos de un cassette grabado como prueba de carga")
+    parser.add_argument("cassette")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clientes simultáneos")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplicador de latencias y llegadas")
+    parser.add_argument("--burst", action="store_true", help="Ignora los instantes de llegada originales")
+    parser.add_argument("--workers", type=int, default=4, help="Workers de ScanService")
+    parser.add_argument("--queue", type=int, default=16, help="Cola de ScanService antes de rechazar")
+    parser.add_argument("--cache-dir", default=None, help="Caché de partida (por defecto, una vacía temporal)")
+    args = parser.parse_args()
+
+    # Los modelos y el cliente de OFF se construyen en modo replay sobre este cassette
+    os.environ["KASHRUT_CASSETTE"] = args.cassette
+    os.environ["KASHRUT_CASSETTE_MODE"] = "replay"
+    os.environ["KASHRUT_REPLAY_SCALE"] = str(args.scale)
+
+    from engine.cache_manager import CacheManager
+    from engine.history_manager import HistoryManager
+    from engine.kashrut_engine import KashrutEngine
+    from engine.off_client import OpenFoodFactsClient
+    from engine.scan_pipeline import ScanPipeline
+    from service.scan_service import ScanService
+
+    entries = _cassette().entries
+    if not any(entry["kind"] == "scan" for entry in entries):
+        print("El cassette no tiene peticiones entrantes grabadas; vuelve a grabar con esta versión.")
+        return
+
+    workdir = tempfile.mkdtemp(prefix="kashrut-replay-")
+    engine = KashrutEngine()
+    off_client = OpenFoodFactsClient()
+    cache = CacheManager(args.cache_dir or os.path.join(workdir, "cache"))
+    service = ScanService(engine, cache=cache, history=HistoryManager(os.path.join(workdir, "history.db")),
+                          off_client=off_client, workers=args.workers, queue_size=args.queue)
+    pipeline = ScanPipeline(engine, off_client, cache)
+    try:
+        report = replay_traffic(entries, service=service, pipeline=pipeline, concurrency=args.concurrency,
+                                scale=args.scale, keep_arrivals=not args.burst)
+    finally:
+        service.shutdown()
+        pipeline.shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Orquestador concurrente del escaneo por fotos.
+
+En lugar de código de barras -> OpenFoodFacts -> análisis en secuencia, arranca
+a la vez la lectura del código de barras y el análisis de las fotos:
+
+- Si el código de barras tiene un veredicto guardado, se responde con él y se
+  descarta el análisis en curso.
+- Si OpenFoodFacts devuelve ingredientes dentro de `context_window` segundos,
+  se lanza en paralelo un análisis especulativo con ese contexto; se prefiere
+  su resultado si llega a más tardar `enrich_grace` segundos después del
+  análisis sin contexto.
+
+Los hilos no se pueden interrumpir: "cancelar" evita que arranquen las tareas
+en cola y descarta el resultado de las que ya están en curso.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from engine.cache_manager import barcode_cache_key
+from engine.off_client import ingredients_of
+from engine.replay import record_scan
+
+SOURCE_CACHE = "cache"
+SOURCE_BARCODE_CACHE = "barcode_cache"
+SOURCE_MODEL = "model"
+SOURCE_MODEL_OFF = "model+off"
+
+
+class ScanPipeline:
+    def __init__(self, engine, off_client, cache, max_workers=8, context_window=3.0, enrich_grace=2.0):
+        self.engine = engine
+        self.off_client = off_client
+        self.cache = cache
+        self.context_window = context_window
+        self.enrich_grace = enrich_grace
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan-pipeline")
+
+    def scan(self, images, cache_key, preferences=None):
+        """
+        Analiza las fotos de un producto.
+        Retorna (resultado, info) donde info incluye 'source', 'barcode' y 'elapsed'.
+        """
+        start = time.perf_counter()
+        info = {"source": SOURCE_CACHE, "barcode": None}
+        record_scan("photos", images=images, key=cache_key, preferences=preferences)
+
+        cached = self.cache.get_cached_result(cache_key)
+        if cached:
+            info["elapsed"] = time.perf_counter() - start
+            return cached, info
+
+        # Decodificar antes de compartir las imágenes entre hilos
+        for image in images:
+            image.load()
+
+        plain = self._executor.submit(self.engine.analyze_product, images, None, preferences)
+        lookup = self._executor.submit(self._lookup_barcode, images, preferences)
+        enriched = None
+        pending = {plain, lookup}
+
+        result = None
+        while result is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            if lookup in done:
+                try:
+                    barcode, verdict, ingredients = lookup.result()
+                except Exception as e:
+                    print(f"Error buscando código de barras: {e}")
+                    barcode, verdict, ingredients = None, None, None
+                info["barcode"] = barcode
+                if verdict:
+                    # Veredicto guardado: el análisis en curso ya no hace falta
+                    self._cancel(plain, enriched)
+                    info["source"] = SOURCE_BARCODE_CACHE
+                    info["elapsed"] = time.perf_counter() - start
+                    return verdict, info
+                in_time = time.perf_counter() - start <= self.context_window
+                if ingredients and in_time and not plain.done():
+                    enriched = self._executor.submit(self.engine.analyze_product, images, ingredients, preferences)
+                    pending.add(enriched)
+
+            if enriched is not None and enriched in done and _usable(enriched.result()):
+                self._cancel(plain)
+                result, info["source"] = enriched.result(), SOURCE_MODEL_OFF
+            elif plain in done:
+                result, info["source"] = plain.result(), SOURCE_MODEL
+                if enriched is not None and not enriched.done():
+                    # Se espera un poco al análisis con contexto, que suele ser más preciso
+                    finished, _ = wait([enriched], timeout=self.enrich_grace)
+                    if finished and _usable(enriched.result()):
+                        result, info["source"] = enriched.result(), SOURCE_MODEL_OFF
+                    else:
+                        self._cancel(enriched)
+            elif not pending:
+                # Sin análisis restante (p. ej. el especulativo falló y el simple ya terminó)
+                result, info["source"] = plain.result(), SOURCE_MODEL
+
+        self._cancel(lookup)
+        if _usable(result):
+            self.cache.save_to_cache(cache_key, result)
+            if info["barcode"]:
+                self.cache.save_to_cache(barcode_cache_key(info["barcode"], preferences), result)
+        info["elapsed"] = time.perf_counter() - start
+        return result, info
+
+    def _lookup_barcode(self, images, preferences):
+        """Lee el código de barras y busca un veredicto guardado o los ingredientes en OFF."""
+        barcode = None
+        for image in images:
+            barcode = self.engine.extract_barcode(image)
+            if barcode:
+                break
+        if not barcode:
+            return None, None, None
+
+        # Solo veredictos de fotos: el del texto de OFF (source="text") no ve los sellos
+        verdict = self.cache.get_cached_result(barcode_cache_key(barcode, preferences))
+        if verdict:
+            return barcode, verdict, None
+
+        off_data = self.off_client.get_product(barcode)
+        return barcode, None, ingredients_of(off_data)
+
+    @staticmethod
+    def _cancel(*futures):
+        for future in futures:
+            if future is not None:
+                future.cancel()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _usable(result):
+    return bool(result) and "error" not in result
@@ -0,0 +1,130 @@
+"""
+Contabilidad de memoria por sesión para la app de Streamlit.
+
+Los datos pesados de cada sesión (último resultado y miniaturas de las fotos)
+viven en un SessionStore compartido por el proceso en lugar de en
+st.session_state, para poder medirlos, limitarlos y liberarlos cuando la
+sesión queda inactiva.
+"""
+import sys
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image
+
+THUMBNAIL_SIZE = (320, 320)
+
+
+def estimate_size(obj, _seen=None):
+    """Estimación en bytes de un objeto y su contenido (incluye píxeles de PIL)."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, Image.Image):
+        return sys.getsizeof(obj) + obj.width * obj.height * len(obj.getbands())
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    return size
+
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE, quality=70):
+    """Reduce una imagen a JPEG pequeño (bytes) para mostrarla sin retener el original."""
+    thumb = image.copy()
+    thumb.thumbnail(size)
+    if thumb.mode not in ("RGB", "L"):
+        thumb = thumb.convert("RGB")
+    buffer = BytesIO()
+    thumb.save(buffer, format="JPEG", quality=quality)
+    thumb.close()
+    return buffer.getvalue()
+
+
+class SessionStore:
+    """
+    Datos por sesión con presupuesto de memoria.
+
+    - `session_budget`: bytes máximos por sesión; si se excede se descartan
+      las miniaturas y se conserva solo el resultado.
+    - `total_budget`: bytes máximos del proceso; se desalojan las sesiones
+      usadas hace más tiempo.
+    - `max_idle`: segundos sin actividad tras los cuales se libera la sesión.
+    """
+
+    def __init__(self, session_budget=2 * 1024 * 1024, total_budget=256 * 1024 * 1024, max_idle=15 * 60):
+        self.session_budget = session_budget
+        self.total_budget = total_budget
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self.evictions = 0
+
+    def touch(self, session_id):
+        """Marca actividad de la sesión y libera las sesiones inactivas."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry:
+                entry["last_seen"] = now
+            self._evict_idle(now)
+
+    def get(self, session_id, key, default=None):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry["data"].get(key, default) if entry else default
+
+    def put(self, session_id, key, value):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.setdefault(session_id, {"data": {}, "bytes": 0, "last_seen": now})
+            entry["data"][key] = value
+            entry["last_seen"] = now
+            entry["bytes"] = estimate_size(entry["data"])
+            if entry["bytes"] > self.session_budget and "thumbnails" in entry["data"]:
+                del entry["data"]["thumbnails"]
+                entry["bytes"] = estimate_size(entry["data"])
+            self._evict_over_budget(keep=session_id)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def usage(self, session_id=None):
+        """Bytes usados por una sesión, o el total del proceso si no se indica."""
+        with self._lock:
+            if session_id is not None:
+                entry = self._sessions.get(session_id)
+                return entry["bytes"] if entry else 0
+            return sum(entry["bytes"] for entry in self._sessions.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": sum(entry["bytes"] for entry in self._sessions.values()),
+                "evictions": self.evictions,
+            }
+
+    def _evict_idle(self, now):
+        idle = [sid for sid, entry in self._sessions.items() if now - entry["last_seen"] > self.max_idle]
+        for sid in idle:
+            del self._sessions[sid]
+        self.evictions += len(idle)
+
+    def _evict_over_budget(self, keep):
+        total = sum(entry["bytes"] for entry in self._sessions.values())
+        if total <= self.total_budget:
+            return
+        for sid in sorted(self._sessions, key=lambda s: self._sessions[s]["last_seen"]):
+            if total <= self.total_budget:
+                break
+            if sid == keep:
+                continue
+            total -= self._sessions.pop(sid)["bytes"]
+            self.evictions += 1
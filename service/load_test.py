@@ -0,0 +1,73 @@
+"""
+Prueba de carga local para service/scan_service.py.
+
+Arranca el servicio con --stub y ejecuta:
+    python service/load_test.py --url http://localhost:8080 --concurrency 32 --requests 500
+
+Cada petición usa un texto distinto (sin aciertos de caché) salvo que se pase
+--repeat, que reutiliza un conjunto pequeño de textos para medir la caché.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _post_text(url, text):
+    body = json.dumps({"text": text}).encode("utf-8")
+    request = urllib.request.Request(f"{url}/scan/text", data=body,
+                                     headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = "conn_error"
+    return status, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio de escaneo")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=0, help="Usa solo N textos distintos")
+    args = parser.parse_args()
+
+    counter = Counter()
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(i):
+        text = f"Ingredientes de prueba #{i % args.repeat if args.repeat else i}"
+        status, latency = _post_text(args.url, text)
+        with lock:
+            counter[status] += 1
+            if status == 200:
+                latencies.append(latency)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"Peticiones: {args.requests} en {elapsed:.1f}s ({args.requests / elapsed:.1f} req/s)")
+    print(f"Estados: {dict(counter)}")
+    if latencies:
+        for p in (50, 95, 99):
+            index = min(len(latencies) - 1, int(p / 100 * len(latencies)))
+            print(f"p{p}: {latencies[index] * 1000:.0f} ms")
+    with urllib.request.urlopen(f"{args.url}/metrics") as response:
+        print("Métricas del servicio:", response.read().decode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""
+Servicio HTTP sin interfaz alrededor de KashrutEngine.
+
+Expone escaneo por imagen, escaneo por texto y búsqueda por código de barras
+para clientes POS / móviles. El trabajo pesado corre en un pool de workers
+acotado; cuando el pool y su cola están llenos se responde 429 antes de leer
+el cuerpo de la petición.
+
+Uso:
+    python service/scan_service.py --port 8080 --workers 4 --queue 16
+    python service/scan_service.py --stub --stub-latency 0.8   # sin Gemini
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+# Add parent directory to path to import engine
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image, UnidentifiedImageError
+
+from engine.cache_manager import CacheManager, barcode_cache_key, product_cache_key, text_cache_key
+from engine.history_manager import HistoryManager
+from engine.off_client import OpenFoodFactsClient, ingredients_of
+from engine.replay import record_scan
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class ServiceSaturated(Exception):
+    """El pool y la cola de admisión están llenos."""
+
+
+class PayloadTooLarge(Exception):
+    """El cuerpo de la petición supera el límite configurado."""
+
+
+class BadRequest(Exception):
+    """Cuerpo o parámetros con una forma inválida; el mensaje se devuelve al cliente."""
+
+
+class InvalidImage(Exception):
+    """El cuerpo no es una imagen que PIL pueda decodificar."""
+
+
+class ServiceMetrics:
+    """Contadores y ventana de latencias para /metrics."""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests = {}
+        self.errors = 0
+        self.rejected = 0
+        self.cache_hits = 0
+        self.in_flight = 0
+        self._latencies = deque(maxlen=window)
+
+    def record(self, endpoint, latency, error=False):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self._latencies.append(latency)
+            if error:
+                self.errors += 1
+
+    def incr(self, name, delta=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            snap = {
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "requests": dict(self.requests),
+                "errors": self.errors,
+                "rejected_429": self.rejected,
+                "cache_hits": self.cache_hits,
+                "in_flight": self.in_flight,
+            }
+        for p in (50, 95, 99):
+            snap[f"latency_p{p}_ms"] = _percentile(latencies, p) * 1000 if latencies else None
+        return snap
+
+
+def _percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ScanService:
+    """
+    Orquesta los componentes del motor detrás de un pool de workers acotado.
+
+    Admite como máximo `workers + queue_size` trabajos a la vez; el resto se
+    rechaza inmediatamente con ServiceSaturated.
+    """
+
+    def __init__(self, engine, cache=None, history=None, off_client=None,
+                 workers=4, queue_size=16, request_timeout=60, max_upload_bytes=10 * 1024 * 1024):
+        self.engine = engine
+        self.cache = cache or CacheManager()
+        self.history = history or HistoryManager()
+        self.off_client = off_client or OpenFoodFactsClient()
+        self.workers = workers
+        self.queue_size = queue_size
+        self.request_timeout = request_timeout
+        self.max_upload_bytes = max_upload_bytes
+        self.metrics = ServiceMetrics()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan-worker")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def try_admit(self):
+        """Reserva un lugar en el pool o lanza ServiceSaturated."""
+        if not self._slots.acquire(blocking=False):
+            self.metrics.incr("rejected")
+            raise ServiceSaturated()
+        self.metrics.incr("in_flight")
+
+    def release(self):
+        self.metrics.incr("in_flight", -1)
+        self._slots.release()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Encola fn en el pool; el llamador ya debe haber sido admitido.
+        El lugar se libera cuando termina la tarea, no cuando el llamador deja
+        de esperarla: tras un timeout la tarea sigue ocupando un worker.
+        """
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self.release())
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Ejecuta fn en el pool y espera su resultado como máximo request_timeout."""
+        return self.submit(fn, *args, **kwargs).result(timeout=self.request_timeout)
+
+    def scan_image(self, image_data, preferences=None):
+        cached = self.cache.get_cached_result(image_data)
+        if cached:
+            self.metrics.incr("cache_hits")
+            return cached, True
+        try:
+            image = Image.open(BytesIO(image_data))
+            image.load()
+        except (UnidentifiedImageError, OSError) as e:
+            raise InvalidImage(str(e)) from e
+        result = self.engine.analyze_product([image], preferences=preferences)
+        self._store(image_data, result)
+        return result, False
+
+    def scan_text(self, text, preferences=None):
+        key = text_cache_key(text, preferences)
+        cached = self.cache.get_cached_result(key)
+        if cached:
+            self.metrics.incr("cache_hits")
+            return cached, True
+        result = self.engine.analyze_text(text, preferences=preferences)
+        self._store(key, result)
+        return result, False
+
+    def lookup_barcode(self, barcode, analyze=False, preferences=None):
+        if not analyze:
+            product = self.off_client.get_product(barcode)
+            return {"product": product} if product else None
+
+        # Veredicto precalculado (engine/precompute.py) y producto guardado: evita la llamada a OFF.
+        # Se prefiere el veredicto de fotos (ve los sellos) sobre el del texto de OFF.
+        product_key = product_cache_key(barcode)
+        text_key = barcode_cache_key(barcode, preferences, source="text")
+        image_verdict, text_verdict, product = self.cache.get_many(
+            [barcode_cache_key(barcode, preferences), text_key, product_key])
+        verdict = image_verdict or text_verdict
+        if product is None:
+            product = self.off_client.get_product(barcode)
+            if product:
+                self.cache.save_to_cache(product_key, product)
+        if verdict:
+            self.metrics.incr("cache_hits")
+            return {"product": product, "result": verdict, "cached": True}
+        if not product:
+            return None
+        ingredients = ingredients_of(product)
+        if not ingredients:
+            # OFF no tiene la lista de ingredientes: el producto sin veredicto
+            return {"product": product, "result": None, "cached": False}
+        verdict, cached = self.scan_text(ingredients, preferences)
+        if not cached and "error" not in verdict:
+            self.cache.save_to_cache(text_key, verdict)
+        return {"product": product, "result": verdict, "cached": cached}
+
+    def _store(self, key, result):
+        if result and "error" not in result:
+            self.history.add_scan(result)
+            self.cache.save_to_cache(key, result)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ScanRequestHandler(BaseHTTPRequestHandler):
+    server_version = "KashrutScan/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # --- Routing ---
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send_json(200, {"status": "ok"})
+        if url.path == "/metrics":
+            snap = self.service.metrics.snapshot()
+            snap.update({"workers": self.service.workers, "queue_size": self.service.queue_size})
+            route_stats = getattr(self.service.engine, "route_stats", None)
+            if route_stats is not None:
+                snap["model_routes"] = route_stats.snapshot()
+            if hasattr(self.service.engine, "hedging_stats"):
+                snap["hedging"] = self.service.engine.hedging_stats()
+            return self._send_json(200, snap)
+        if url.path.startswith("/barcode/"):
+            barcode = url.path[len("/barcode/"):]
+            if not barcode.isdigit():
+                return self._send_json(400, {"error": "Código de barras inválido."})
+            query = parse_qs(url.query)
+            analyze = query.get("analyze", ["0"])[0] in ("1", "true")
+            return self._handle("barcode", self._barcode, barcode, analyze)
+        return self._send_json(404, {"error": "Ruta no encontrada."})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path == "/scan/image":
+            return self._handle("scan_image", self._scan_image, url)
+        if url.path == "/scan/text":
+            return self._handle("scan_text", self._scan_text)
+        return self._send_json(404, {"error": "Ruta no encontrada."})
+
+    # --- Handlers (run after admission) ---
+
+    def _scan_image(self, url):
+        image_data = self._read_body()
+        if not image_data:
+            return 400, {"error": "Cuerpo vacío: envía los bytes de la imagen."}
+        prefs_raw = parse_qs(url.query).get("preferences", [None])[0]
+        preferences = _check_preferences(json.loads(prefs_raw) if prefs_raw else None)
+        record_scan("image", images=[image_data], preferences=preferences)
+        result, cached = self._run(self.service.scan_image, image_data, preferences)
+        return self._result_status(result), {"result": result, "cached": cached}
+
+    def _scan_text(self):
+        payload = json.loads(self._read_body() or b"{}")
+        if not isinstance(payload, dict):
+            raise BadRequest("El cuerpo debe ser un objeto JSON.")
+        text = payload.get("text")
+        if not text:
+            return 400, {"error": "Falta el campo 'text'."}
+        if not isinstance(text, str):
+            raise BadRequest("El campo 'text' debe ser una cadena.")
+        preferences = _check_preferences(payload.get("preferences"))
+        record_scan("text", text=text, preferences=preferences)
+        result, cached = self._run(self.service.scan_text, text, preferences)
+        return self._result_status(result), {"result": result, "cached": cached}
+
+    def _barcode(self, barcode, analyze):
+        record_scan("barcode", barcode=barcode, analyze=analyze)
+        data = self._run(self.service.lookup_barcode, barcode, analyze)
+        if not data:
+            return 404, {"error": "Producto no encontrado."}
+        return 200, data
+
+    def _handle(self, endpoint, fn, *args):
+        start = time.perf_counter()
+        try:
+            self.service.try_admit()
+        except ServiceSaturated:
+            # Cuerpos pequeños se descartan para conservar la conexión;
+            # las subidas grandes no se leen y se cierra la conexión.
+            length = int(self.headers.get("Content-Length") or 0)
+            headers = {"Retry-After": "1"}
+            if length <= UPLOAD_CHUNK_SIZE:
+                self.rfile.read(length)
+            else:
+                self.close_connection = True
+                headers["Connection"] = "close"
+            return self._send_json(429, {"error": "Servicio saturado, reintenta."}, headers=headers)
+
+        status, body = 500, {"error": "Error interno."}
+        self._submitted = False
+        try:
+            status, body = fn(*args)
+        except PayloadTooLarge:
+            self.close_connection = True
+            status, body = 413, {"error": "Imagen demasiado grande."}
+        except FutureTimeout:
+            status, body = 504, {"error": "Tiempo de análisis agotado."}
+        except InvalidImage:
+            status, body = 400, {"error": "No se pudo leer la imagen: formato no soportado o archivo dañado."}
+        except json.JSONDecodeError:
+            status, body = 400, {"error": "JSON inválido."}
+        except BadRequest as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            print(f"Error en {endpoint}: {e}")
+            status, body = 500, {"error": str(e)}
+        finally:
+            if not self._submitted:
+                # Si la tarea llegó al pool, la libera su callback al terminar
+                self.service.release()
+            self.service.metrics.record(endpoint, time.perf_counter() - start, error=status >= 500)
+        return self._send_json(status, body)
+
+    # --- Helpers ---
+
+    def _run(self, fn, *args):
+        future = self.service.submit(fn, *args)
+        self._submitted = True
+        return future.result(timeout=self.service.request_timeout)
+
+    def _read_body(self):
+        """Lee el cuerpo en bloques, cortando en cuanto supera el límite."""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.service.max_upload_bytes:
+            raise PayloadTooLarge()
+        buffer = BytesIO()
+        remaining = length
+        while remaining > 0:
+            chunk = self.rfile.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            buffer.write(chunk)
+            remaining -= len(chunk)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _result_status(result):
+        return 502 if not result or "error" in result else 200
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _check_preferences(preferences):
+    if preferences is not None and not isinstance(preferences, dict):
+        raise BadRequest("'preferences' debe ser un objeto JSON.")
+    return preferences
+
+
+class ScanHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, ScanRequestHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+def build_service(args):
+    if args.stub:
+        from service.stubs import StubEngine, StubOFFClient
+        engine = StubEngine(latency=args.stub_latency)
+        off_client = StubOFFClient(latency=args.stub_latency / 4)
+    else:
+        from engine.kashrut_engine import KashrutEngine
+        engine = KashrutEngine()
+        off_client = OpenFoodFactsClient()
+    return ScanService(
+        engine,
+        cache=CacheManager(args.cache_dir),
+        history=HistoryManager(args.db_path),
+        off_client=off_client,
+        workers=args.workers,
+        queue_size=args.queue,
+        request_timeout=args.timeout,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP de escaneo Kashrut")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue", type=int, default=16, help="Trabajos en espera antes de responder 429")
+    parser.add_argument("--timeout", type=float, default=60, help="Segundos máximos por análisis")
+    parser.add_argument("--cache-dir", default="data/cache")
+    parser.add_argument("--db-path", default="kashrut_history.db")
+    parser.add_argument("--stub", action="store_true", help="Usa modelos simulados (pruebas de carga)")
+    parser.add_argument("--stub-latency", type=float, default=0.8)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    service = build_service(args)
+    server = ScanHTTPServer((args.host, args.port), service, verbose=args.verbose)
+    print(f"Servicio de escaneo en http://{args.host}:{args.port} "
+          f"(workers={args.workers}, cola={args.queue}, stub={args.stub})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Backends simulados para probar el servicio sin Gemini ni OpenFoodFacts.
+
+Imitan las firmas de KashrutEngine y OpenFoodFactsClient y duermen una
+latencia configurable para que las pruebas de carga sean realistas.
+"""
+import random
+import time
+
+STUB_RESULT = {
+    "resultado": "Kosher",
+    "confianza_analisis": "90%",
+    "sello_detectado": "OU",
+    "categoria": "Parve",
+    "alertas": ["Ninguno"],
+    "explicacion_halajica": "Resultado simulado para pruebas de carga."
+}
+
+
+class StubEngine:
+    def __init__(self, latency=0.8, jitter=0.25):
+        self.latency = latency
+        self.jitter = jitter
+
+    def _sleep(self):
+        time.sleep(max(0.0, random.gauss(self.latency, self.latency * self.jitter)))
+
+    def analyze_product(self, images, extra_context=None, preferences=None):
+        self._sleep()
+        return dict(STUB_RESULT, producto="Producto simulado")
+
+    def analyze_text(self, text: str, preferences=None):
+        self._sleep()
+        return dict(STUB_RESULT, producto=text[:40])
+
+    def extract_barcode(self, image):
+        self._sleep()
+        return "7501000000001"
+
+
+class StubOFFClient:
+    def __init__(self, latency=0.2):
+        self.latency = latency
+
+    def get_product(self, barcode):
+        if not barcode:
+            return None
+        time.sleep(self.latency)
+        return {
+            "product_name": f"Producto {barcode}",
+            "ingredients_text": f"Azúcar, agua, sal, saborizante natural ({barcode})",
+            "brands": "Marca simulada",
+            "image_url": ""
+        }
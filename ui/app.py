@@ -3,15 +3,18 @@ from PIL import Image
 import io
 import sys
 import os
+import uuid
 
 # Add parent directory to path to import engine
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from engine.kashrut_engine import KashrutEngine
-from engine.cache_manager import CacheManager
+from engine.cache_manager import DEFAULT_PREFERENCES, CacheManager
 from engine.agency_registry import check_agency
 from engine.history_manager import HistoryManager
 from engine.off_client import OpenFoodFactsClient
+from engine.session_budget import SessionStore, make_thumbnail
+from engine.scan_pipeline import ScanPipeline
 
 st.set_page_config(
     page_title="KosherScan - Digital Mashgiach",
@@ -20,25 +23,56 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Initialize components in session state
+# Shared components: one instance per process, not per session
+@st.cache_resource
+def get_engine():
+    return KashrutEngine()
+
+@st.cache_resource
+def get_history_manager():
+    return HistoryManager()
+
+@st.cache_resource
+def get_off_client():
+    return OpenFoodFactsClient()
+
+@st.cache_resource
+def get_cache():
+    return CacheManager()
+
+@st.cache_resource
+def get_pipeline():
+    return ScanPipeline(get_engine(), get_off_client(), get_cache())
+
+@st.cache_resource
+def get_session_store():
+    return SessionStore()
+
+# Session state only keeps references to the shared components
 if 'engine' not in st.session_state:
     try:
-        st.session_state.engine = KashrutEngine()
+        st.session_state.engine = get_engine()
+        st.session_state.pipeline = get_pipeline()
     except Exception as e:
         st.error(f"Error de configuración: {e}")
 
 if 'history' not in st.session_state:
-    st.session_state.history = HistoryManager()
+    st.session_state.history = get_history_manager()
 
 if 'off_client' not in st.session_state:
-    st.session_state.off_client = OpenFoodFactsClient()
+    st.session_state.off_client = get_off_client()
+
+# Heavy per-session data (result, thumbnails) lives in the budgeted store
+store = get_session_store()
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'uploader_key' not in st.session_state:
+    st.session_state.uploader_key = 0
+session_id = st.session_state.session_id
+store.touch(session_id)
 
 if 'preferences' not in st.session_state:
-    st.session_state.preferences = {
-        "jalav_stam": "Permitido",
-        "pesaj_tradicion": "Sefaradí (Kitniyot OK)",
-        "rigor": "Regular"
-    }
+    st.session_state.preferences = dict(DEFAULT_PREFERENCES)
 
 # Custom CSS for premium feel
 # Custom CSS for high-fidelity mobile look
@@ -187,11 +221,10 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # --- APP STATE & NAVIGATION ---
-if 'last_result' not in st.session_state:
-    st.session_state.last_result = None
+last_result = store.get(session_id, "last_result")
 
 # Custom Header (Mobile Look)
-if st.session_state.last_result:
+if last_result:
     header_title = "Results"
     left_icon = "❮"
     left_action = "onclick='window.location.reload();'" # Hack to reset
@@ -208,12 +241,19 @@ st.markdown(f"""
     </div>
 """, unsafe_allow_html=True)
 
+def release_uploads(images):
+    """Closes decoded images and resets the uploader so Streamlit drops the file bytes."""
+    for img in images:
+        img.close()
+    images.clear()
+    st.session_state.uploader_key += 1
+
 # Tabs (Styled as Bottom Nav approximation)
 # Use shorter labels to fit mobile screen widths
 tab1, tab2, tab3, tab4, tab5 = st.tabs(["🏠 Home", "⭐ Rec", "📜 Hist", "📚 Glos", "👤 Prof"])
 
 with tab1:
-    if not st.session_state.last_result:
+    if not last_result:
         # --- SCANNER VIEW ---
         st.markdown("""
             <div class="scanner-wrapper">
@@ -242,7 +282,8 @@ with tab1:
                 "Upload Photo", 
                 type=['jpg', 'jpeg', 'png', 'webp'],
                 accept_multiple_files=True,
-                label_visibility="collapsed"
+                label_visibility="collapsed",
+                key=f"uploader_{st.session_state.uploader_key}"
             )
             st.markdown('</div>', unsafe_allow_html=True)
 
@@ -250,37 +291,26 @@ with tab1:
             images = [Image.open(file) for file in uploaded_files]
             combined_bytes = b"".join([file.getvalue() for file in uploaded_files])
             
-            # Check cache
-            cached_result = cache.get_from_cache(combined_bytes)
-            if cached_result:
-                st.session_state.last_result = cached_result
+            # Barcode/OFF lookup, cache checks and analysis run concurrently
+            with st.spinner('Analizando...'):
+                result, scan_info = st.session_state.pipeline.scan(
+                    images,
+                    combined_bytes,
+                    preferences=st.session_state.preferences
+                )
+
+            if result and "error" not in result:
+                if scan_info["source"] not in ("cache", "barcode_cache"):
+                    st.session_state.history.add_scan(result)
+                store.put(session_id, "last_result", result)
+                store.put(session_id, "thumbnails", [make_thumbnail(img) for img in images])
+                release_uploads(images)
                 st.rerun()
             else:
-                with st.spinner('Analizando...'):
-                    # 1. Barcode check
-                    off_data = None
-                    try:
-                        off_data = st.session_state.off_client.scan_and_get_details(images)
-                    except: pass
-                    
-                    # 2. Análisis Final
-                    extra_context = off_data.get('ingredients_text') if off_data else None
-                    result = st.session_state.engine.analyze_product(
-                        images, 
-                        extra_context=extra_context,
-                        preferences=st.session_state.preferences
-                    )
-                    
-                    if result and "error" not in result:
-                        st.session_state.history.add_scan(result)
-                        cache.save_to_cache(combined_bytes, result)
-                        st.session_state.last_result = result
-                        st.rerun()
-                    else:
-                        st.error("Error en el análisis de la IA.")
+                st.error("Error en el análisis de la IA.")
     else:
         # --- RESULTS VIEW ---
-        result = st.session_state.last_result
+        result = last_result
         status = result.get('resultado', 'Dudoso')
         conf = result.get('confianza_analisis', 'N/A')
         banner_color = "#4ade80" if "KOSHER" in status.upper() and "NO" not in status.upper() else "#f87171"
@@ -297,6 +327,10 @@ with tab1:
             <div class="results-bg">
         """, unsafe_allow_html=True)
 
+        thumbnails = store.get(session_id, "thumbnails")
+        if thumbnails:
+            st.image(thumbnails, width=120)
+
         # Main Cards
         st.markdown(f"""
             <div class="result-card">
@@ -345,7 +379,7 @@ with tab1:
         with col_back[1]:
             st.write("")
             if st.button("❮ Back to Scanner", key="back_to_scan"):
-                st.session_state.last_result = None
+                store.clear(session_id)
                 st.rerun()
 
 with tab2: